@@ -1,26 +1,29 @@
 #!/usr/bin/env python3
 # filepath: /home/ubuntu/docker/webmining/patagonia-scrappers-src/app/extrae-bluesky-postgres.py
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
-from datetime import datetime
+import numpy as np
+from datetime import timezone
 import os
+import json
+import time
+import base64
+import threading
 import logging
 import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 from pathlib import Path
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from models import SessionLocal, TablaPostsBluesky, init_db
+from sqlalchemy import func, select
+from models import SessionLocal, TablaPostsBluesky, bulk_copy, init_db
 from textblob import TextBlob
+from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 
-# Instalar vaderSentiment si no está disponible
-try:
-    from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
-except ImportError:
-    import subprocess
-    import sys
-    logging.info("Instalando vaderSentiment...")
-    subprocess.check_call([sys.executable, "-m", "pip", "install", "vaderSentiment"])
-    from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+# Analizador VADER compartido: el léxico se carga una sola vez por proceso
+_VADER = SentimentIntensityAnalyzer()
 
 # Configuración de logging
 logging.basicConfig(
@@ -35,12 +38,21 @@ logger = logging.getLogger(__name__)
 
 # Constantes
 DEFAULT_POSTS_LIMIT = 100
+API_PAGE_LIMIT = 100  # máximo de posts por página que acepta getAuthorFeed
 API_BASE_URL = "https://bsky.social/xrpc"
 API_AUTH_ENDPOINT = "com.atproto.server.createSession"
+API_REFRESH_ENDPOINT = "com.atproto.server.refreshSession"
 API_SEARCH_ENDPOINT = "app.bsky.actor.searchActors"
 API_FEED_ENDPOINT = "app.bsky.feed.getAuthorFeed"
+MAX_CONCURRENT_REQUESTS = 8  # requests simultáneos a la API (evita rate limits)
+FEED_COLUMNS = ['actor_handle', 'uri', 'text', 'created_at', 'likes', 'reposts', 'replies']
+CATEGORY_COLUMNS = ['actor_handle']  # pocos valores distintos por ejecución
 USERNAME = os.environ.get("BLUESKY_USERNAME")
 PASSWORD = os.environ.get("BLUESKY_PASSWORD")
+TOKEN_CACHE_FILE = os.path.expanduser(
+    os.environ.get("BLUESKY_TOKEN_CACHE", "~/.cache/bluesky_token.json")
+)
+TOKEN_EXPIRY_MARGIN = 60  # segundos de vigencia mínima para reutilizar el token
 #SEARCH_TERMS = ["bloomberg", "aoc", "economist"]
 SEARCH_TERMS = [
     "mclem.org",
@@ -63,6 +75,11 @@ SEARCH_TERMS = [
 # Umbrales de sentimiento
 POSITIVE_THRESHOLD = 0.05
 NEGATIVE_THRESHOLD = -0.05
+SENTIMENT_LABELS = ['Positivo', 'Negativo', 'Neutral']
+
+# Por debajo de esta cantidad de posts el análisis se hace en serie
+PARALLEL_MIN_POSTS = 500
+PARALLEL_CHUNKSIZE = 64
 
 
 def parse_args():
@@ -82,11 +99,106 @@ def parse_args():
         default=DEFAULT_POSTS_LIMIT, 
         help=f'Máximo de posts por actor. Por defecto: {DEFAULT_POSTS_LIMIT}'
     )
+    parser.add_argument(
+        '--search-terms',
+        nargs='+',
+        default=SEARCH_TERMS,
+        help='Términos de búsqueda de actores. Por defecto: los definidos en el script'
+    )
+    parser.add_argument(
+        '--sentiment',
+        choices=['vader', 'both'],
+        default='vader',
+        help='Analizadores de sentimiento a usar: solo VADER o VADER y TextBlob. Por defecto: vader'
+    )
     return parser.parse_args()
 
 
-def connect_to_bluesky():
+def create_http_session():
+    """Crea una sesión HTTP con pool de conexiones keep-alive y reintentos"""
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 502, 503, 504])
+    adapter = HTTPAdapter(
+        pool_connections=MAX_CONCURRENT_REQUESTS,
+        pool_maxsize=MAX_CONCURRENT_REQUESTS,
+        max_retries=retry
+    )
+    session.mount('https://', adapter)
+    return session
+
+
+# Sesión compartida por todos los requests: reutiliza conexiones TCP/TLS
+SESSION = create_http_session()
+# Evita que varios hilos re-autentiquen a la vez tras un 401
+_AUTH_LOCK = threading.Lock()
+
+
+def load_cached_session():
+    """Lee la sesión de Bluesky cacheada en disco, si existe y es del usuario actual"""
+    try:
+        with open(TOKEN_CACHE_FILE, encoding='utf-8') as f:
+            cached = json.load(f)
+        if cached.get('identifier') == USERNAME:
+            return cached
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def jwt_expiry(token):
+    """Devuelve el campo `exp` (epoch) del payload de un JWT, sin verificar la firma"""
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload)).get('exp')
+    except (IndexError, ValueError, AttributeError):
+        return None
+
+
+def save_cached_session(session_data):
+    """Guarda los tokens de la sesión en disco con permisos 0600"""
+    cached = {
+        'identifier': USERNAME,
+        'access': session_data['accessJwt'],
+        'refresh': session_data['refreshJwt'],
+        'exp': jwt_expiry(session_data['accessJwt'])
+    }
+    try:
+        os.makedirs(os.path.dirname(TOKEN_CACHE_FILE), exist_ok=True)
+        fd = os.open(TOKEN_CACHE_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(cached, f)
+    except OSError as e:
+        logger.warning(f"No se pudo guardar el token en caché: {e}")
+
+
+def refresh_session(refresh_jwt):
+    """Renueva la sesión usando el refresh token; devuelve los datos de sesión o None"""
+    url_refresh = f"{API_BASE_URL}/{API_REFRESH_ENDPOINT}"
+    try:
+        response = SESSION.post(url_refresh, headers={"Authorization": f"Bearer {refresh_jwt}"})
+        response.raise_for_status()
+        return response.json()
+    except requests.exceptions.RequestException as e:
+        logger.warning(f"No se pudo renovar la sesión de Bluesky: {e}")
+        return None
+
+
+def connect_to_bluesky(force_login=False):
     """Conecta a la API de Bluesky y obtiene el token de autenticación"""
+    # Reutilizar el token cacheado mientras esté vigente
+    cached = None if force_login else load_cached_session()
+    if cached:
+        exp = cached.get('exp') or jwt_expiry(cached['access'])
+        if exp and exp - time.time() > TOKEN_EXPIRY_MARGIN:
+            logger.info("Usando token de Bluesky en caché")
+            return cached['access']
+        session_data = refresh_session(cached['refresh'])
+        if session_data:
+            save_cached_session(session_data)
+            logger.info("Sesión de Bluesky renovada")
+            return session_data['accessJwt']
+    
     logger.info("Conectando a la API de Bluesky")
     url_se = f"{API_BASE_URL}/{API_AUTH_ENDPOINT}"
     payload = {
@@ -95,72 +207,97 @@ def connect_to_bluesky():
     }
     
     try:
-        response_tk = requests.post(url_se, json=payload)
+        response_tk = SESSION.post(url_se, json=payload, headers={"Authorization": None})
         response_tk.raise_for_status()
-        token = response_tk.json()["accessJwt"]
+        session_data = response_tk.json()
+        save_cached_session(session_data)
         logger.info("Conexión exitosa con la API de Bluesky")
-        return token
+        return session_data["accessJwt"]
     except requests.exceptions.RequestException as e:
         logger.error(f"Error al conectar con la API de Bluesky: {e}")
         return None
 
 
-def search_actors(token, search_terms):
+def api_get(session, url, params):
+    """GET autenticado a la API; ante un 401 inicia sesión nuevamente y reintenta una vez"""
+    auth_used = session.headers.get('Authorization')
+    response = session.get(url, params=params)
+    if response.status_code == 401:
+        with _AUTH_LOCK:
+            # Otro hilo puede haber renovado el token mientras tanto
+            if session.headers.get('Authorization') == auth_used:
+                logger.warning("Token de Bluesky rechazado (401), iniciando sesión nuevamente")
+                token = connect_to_bluesky(force_login=True)
+                if token:
+                    session.headers.update({"Authorization": f"Bearer {token}"})
+        response = session.get(url, params=params)
+    response.raise_for_status()
+    return response
+
+
+def search_actor(session, term):
+    """Busca el actor más relevante para un término de búsqueda"""
+    logger.info(f"Buscando término: '{term}'")
+    search_url = f"{API_BASE_URL}/{API_SEARCH_ENDPOINT}"
+    params = {
+        "term": term,
+        "limit": 1  # Solo obtenemos el resultado más relevante
+    }
+    try:
+        response = api_get(session, search_url, params)
+        search_data = response.json()
+        
+        if search_data.get('actors'):
+            actor = search_data['actors'][0]
+            logger.info(f"Actor encontrado: {actor['handle']}")
+            return actor['handle']
+        logger.warning(f"No se encontraron resultados para el término: '{term}'")
+            
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Error al buscar el término '{term}': {e}")
+    return None
+
+
+def search_actors(session, search_terms):
     """Busca actores basado en una lista de términos de búsqueda"""
     logger.info(f"Buscando actores con los términos: {search_terms}")
-    search_url = f"{API_BASE_URL}/{API_SEARCH_ENDPOINT}"
-    headers = {"Authorization": f"Bearer {token}"}
+    if not search_terms:
+        return []
     
-    found_actors = []
-    actor_handles = []
-    
-    for term in search_terms:
-        logger.info(f"Buscando término: '{term}'")
-        params = {
-            "term": term,
-            "limit": 1  # Solo obtenemos el resultado más relevante
-        }
-        try:
-            response = requests.get(search_url, headers=headers, params=params)
-            response.raise_for_status()
-            search_data = response.json()
-            
-            if search_data.get('actors'):
-                actor = search_data['actors'][0]
-                logger.info(f"Actor encontrado: {actor['handle']}")
-                actor_handles.append(actor['handle'])
-            else:
-                logger.warning(f"No se encontraron resultados para el término: '{term}'")
-                
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error al buscar el término '{term}': {e}")
+    # Las búsquedas son I/O-bound: se lanzan en paralelo y se recogen en orden
+    max_workers = min(MAX_CONCURRENT_REQUESTS, len(search_terms))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        found = executor.map(lambda term: search_actor(session, term), search_terms)
+        actor_handles = [handle for handle in found if handle]
     
-    # Eliminar duplicados
-    actor_handles = list(set(actor_handles))
+    # Eliminar duplicados conservando el orden de búsqueda
+    actor_handles = list(dict.fromkeys(actor_handles))
     logger.info(f"Se encontraron {len(actor_handles)} actores únicos para procesar")
     
     return actor_handles
 
 
-def get_actor_feeds(token, actor_handles, posts_limit_per_actor=DEFAULT_POSTS_LIMIT):
-    """Obtiene los feeds para una lista de handles de actores"""
-    logger.info(f"Obteniendo feeds para {len(actor_handles)} actores (límite: {posts_limit_per_actor} posts por actor)")
+def get_actor_feed(session, handle, posts_limit_per_actor=DEFAULT_POSTS_LIMIT, latest_date=None):
+    """Obtiene el feed de un único actor, paginando hasta el límite o hasta llegar a latest_date"""
+    logger.info(f"Obteniendo feed de '{handle}'")
     feed_url = f"{API_BASE_URL}/{API_FEED_ENDPOINT}"
-    headers = {"Authorization": f"Bearer {token}"}
-    
-    all_posts = []
     
-    for handle in actor_handles:
-        logger.info(f"Obteniendo feed de '{handle}'")
-        params = {
-            "actor": handle,
-            "limit": posts_limit_per_actor
-        }
-        try:
-            response = requests.get(feed_url, headers=headers, params=params)
-            response.raise_for_status()
+    columns = {col: [] for col in FEED_COLUMNS}
+    cursor = None
+    try:
+        while len(columns['uri']) < posts_limit_per_actor:
+            params = {
+                "actor": handle,
+                "limit": min(API_PAGE_LIMIT, posts_limit_per_actor - len(columns['uri']))
+            }
+            if cursor:
+                params["cursor"] = cursor
+            
+            response = api_get(session, feed_url, params)
             feed_data = response.json()
             
+            page_start = len(columns['uri'])
+            own_posts = []
             for item in feed_data.get('feed', []):
                 post = item.get('post')
                 if not post or 'record' not in post:
@@ -169,58 +306,103 @@ def get_actor_feeds(token, actor_handles, posts_limit_per_actor=DEFAULT_POSTS_LI
                 
                 record = post.get('record', {})
                 created_at_str = record.get('createdAt', '')
-                created_at_dt = None
-                
-                if created_at_str:
-                    try:
-                        created_at_dt = datetime.fromisoformat(created_at_str.replace('Z', '+00:00'))
-                    except ValueError:
-                        logger.warning(f"Formato de fecha inválido en post de {handle}, omitiendo")
-                        continue
                 
-                likes = post.get('likeCount', 0)
-                reposts = post.get('repostCount', 0)
-                replies = post.get('replyCount', 0)
+                # Solo agregar posts con fechas válidas
+                if not created_at_str:
+                    continue
                 
-                post_data = {
-                    'actor_handle': handle,
-                    'uri': post.get('uri', ''),
-                    'text': record.get('text', ''),
-                    'created_at': created_at_dt,
-                    'likes': likes,
-                    'reposts': reposts,
-                    'replies': replies,
-                    'engagement': likes + reposts + replies
-                }
+                # Acumular por columnas: el DataFrame se arma una sola vez al final
+                columns['actor_handle'].append(handle)
+                columns['uri'].append(post.get('uri', ''))
+                columns['text'].append(record.get('text', ''))
+                columns['created_at'].append(created_at_str)  # se parsea en bloque
+                columns['likes'].append(post.get('likeCount', 0))
+                columns['reposts'].append(post.get('repostCount', 0))
+                columns['replies'].append(post.get('replyCount', 0))
+                own_posts.append('reason' not in item)
+            
+            # El feed viene del más nuevo al más viejo: al primer post propio ya
+            # guardado se deja de paginar (los reposts conservan la fecha original)
+            reached_known_posts = False
+            if latest_date and own_posts:
+                page_dates = pd.to_datetime(
+                    columns['created_at'][page_start:], utc=True, errors='coerce', format='ISO8601'
+                )
+                known = np.flatnonzero(np.array(own_posts) & (page_dates <= latest_date))
+                if len(known):
+                    reached_known_posts = True
+                    for values in columns.values():
+                        del values[page_start + known[0]:]
+            
+            cursor = feed_data.get('cursor')
+            if reached_known_posts or not cursor or not feed_data.get('feed'):
+                break
                 
-                # Solo agregar posts con fechas válidas
-                if post_data['created_at']:
-                    all_posts.append(post_data)
-                    
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error al obtener feed de '{handle}': {e}")
-        except Exception as e:
-            logger.error(f"Error al procesar feed de '{handle}': {e}")
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Error al obtener feed de '{handle}': {e}")
+    except Exception as e:
+        logger.error(f"Error al procesar feed de '{handle}': {e}")
+    
+    return columns
+
+
+def get_actor_feeds(session, actor_handles, posts_limit_per_actor=DEFAULT_POSTS_LIMIT, latest_dates=None):
+    """
+    Obtiene los feeds para una lista de handles de actores como DataFrame. latest_dates
+    (handle -> fecha del último post guardado) corta la paginación de cada actor; los
+    actores que no figuran se traen completos hasta el límite.
+    """
+    latest_dates = latest_dates or {}
+    logger.info(f"Obteniendo feeds para {len(actor_handles)} actores (límite: {posts_limit_per_actor} posts por actor)")
     
-    logger.info(f"Total de posts obtenidos: {len(all_posts)}")
-    return all_posts
+    columns = {col: [] for col in FEED_COLUMNS}
+    if actor_handles:
+        # Un request por actor, en paralelo: el tiempo total es ~1 RTT en lugar de N
+        max_workers = min(MAX_CONCURRENT_REQUESTS, len(actor_handles))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            feeds = executor.map(
+                lambda handle: get_actor_feed(session, handle, posts_limit_per_actor, latest_dates.get(handle)),
+                actor_handles
+            )
+            for feed_columns in feeds:
+                for col, values in feed_columns.items():
+                    columns[col].extend(values)
+    
+    df = pd.DataFrame(columns)
+    df['engagement'] = df['likes'] + df['reposts'] + df['replies']
+    
+    # Parseo vectorizado de las fechas ISO-8601; las inválidas quedan como NaT y se descartan
+    df['created_at'] = pd.to_datetime(df['created_at'], utc=True, errors='coerce', format='ISO8601')
+    invalid_dates = df['created_at'].isna()
+    if invalid_dates.any():
+        logger.warning(f"Se omitieron {invalid_dates.sum()} posts con formato de fecha inválido")
+        df = df[~invalid_dates]
+    
+    logger.info(f"Total de posts obtenidos: {len(df)}")
+    return optimize_dtypes(df)
+
+
+def optimize_dtypes(df):
+    """Reduce la memoria de los posts: conteos al menor entero posible y el handle como category"""
+    # Los scores de sentimiento siguen en float64, igual que las columnas Float de tabla_posts_bluesky
+    for col in df.select_dtypes(include='integer').columns:
+        df[col] = pd.to_numeric(df[col], downcast='integer')
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
 
 
 def filter_posts_by_date(df, start_date_str, end_date_str):
-    """Filtra posts por rango de fechas"""
+    """Filtra posts por rango de fechas (df indexado y ordenado por created_at en UTC)"""
     logger.info(f"Filtrando posts entre {start_date_str} y {end_date_str}")
     
     try:
-        if not pd.api.types.is_datetime64_any_dtype(df['created_at']):
-            df['created_at'] = pd.to_datetime(df['created_at'])
-        
-        if df['created_at'].dt.tz is None:
-            df['created_at'] = df['created_at'].dt.tz_localize('UTC')
-        
-        start_date = pd.to_datetime(start_date_str + ' 00:00:00+00:00')
-        end_date = pd.to_datetime(end_date_str + ' 23:59:59+00:00')
+        start_date = pd.Timestamp(start_date_str, tz='UTC')
+        end_date = pd.Timestamp(end_date_str, tz='UTC') + pd.Timedelta(days=1, seconds=-1)
         
-        filtered_df = df[(df['created_at'] >= start_date) & (df['created_at'] <= end_date)].copy()
+        # Slice por búsqueda binaria sobre el índice ordenado
+        filtered_df = df.loc[start_date:end_date]
         logger.info(f"Posts después del filtrado: {len(filtered_df)} (de {len(df)} posts originales)")
         
         return filtered_df
@@ -229,135 +411,126 @@ def filter_posts_by_date(df, start_date_str, end_date_str):
         return df
 
 
-def get_latest_date_from_db():
-    """Obtiene la fecha más reciente de los posts almacenados en la base de datos"""
+def get_latest_dates_from_db(actor_handles):
+    """
+    Obtiene la fecha del último post guardado de cada actor (en UTC). Un máximo global
+    cortaría la historia de los actores nuevos o atrasados respecto del más reciente.
+    """
     try:
         with SessionLocal() as db:
-            latest_date = db.query(func.max(TablaPostsBluesky.created_at)).scalar()
-            if latest_date:
-                logger.info(f"Último post en la base de datos: {latest_date.strftime('%Y-%m-%d %H:%M:%S')}")
-            else:
-                logger.info("No hay posts previos en la base de datos")
-            return latest_date
+            # MAX(created_at) ... GROUP BY actor_handle: lo resuelve ix_posts_bluesky_actor_created_at
+            rows = db.execute(
+                select(TablaPostsBluesky.actor_handle, func.max(TablaPostsBluesky.created_at))
+                .where(TablaPostsBluesky.actor_handle.in_(actor_handles))
+                .group_by(TablaPostsBluesky.actor_handle)
+            ).all()
+        # Las fechas se guardan sin zona (en UTC)
+        latest_dates = {
+            handle: latest if latest.tzinfo else latest.replace(tzinfo=timezone.utc)
+            for handle, latest in rows
+        }
+        logger.info(f"Actores con posts previos en la base de datos: {len(latest_dates)} de {len(actor_handles)}")
+        return latest_dates
     except Exception as e:
-        logger.error(f"Error al consultar la última fecha en la base de datos: {e}")
-        return None
+        logger.error(f"Error al consultar las últimas fechas en la base de datos: {e}")
+        return {}
 
 
-def analyze_sentiment_textblob(text):
-    """Analiza el sentimiento usando TextBlob"""
+def textblob_polarity(text):
+    """Calcula la polaridad de TextBlob para un texto (0 si falla)"""
     try:
-        sentiment = TextBlob(str(text)).sentiment.polarity
-        # Clasificar el sentimiento
-        if sentiment > POSITIVE_THRESHOLD:
-            label = 'Positivo'
-        elif sentiment < NEGATIVE_THRESHOLD:
-            label = 'Negativo'
-        else:
-            label = 'Neutral'
-        return sentiment, label
-    except:
-        return 0, 'Neutral'
-
-
-def analyze_sentiment_vader(text):
-    """Analiza el sentimiento usando VADER"""
+        return TextBlob(text).sentiment.polarity
+    except Exception:
+        return 0.0
+
+
+def vader_compound(text):
+    """Calcula el puntaje compuesto de VADER para un texto (0 si falla)"""
     try:
-        analyzer = SentimentIntensityAnalyzer()
-        vs = analyzer.polarity_scores(str(text))
-        sentiment = vs['compound']
-        # Clasificar el sentimiento
-        if sentiment >= POSITIVE_THRESHOLD:
-            label = 'Positivo'
-        elif sentiment <= NEGATIVE_THRESHOLD:
-            label = 'Negativo'
-        else:
-            label = 'Neutral'
-        return sentiment, label
-    except:
-        return 0, 'Neutral'
-
-
-def analyze_sentiments(df):
-    """Analiza el sentimiento de todos los posts usando TextBlob y VADER"""
+        return _VADER.polarity_scores(text)['compound']
+    except Exception:
+        return 0.0
+
+
+def score_text(text, use_textblob=True):
+    """Devuelve (polaridad TextBlob, compuesto VADER) para un texto"""
+    # Textos vacíos: no vale la pena tokenizarlos
+    if not text.strip():
+        return (0.0 if use_textblob else np.nan), 0.0
+    textblob_score = textblob_polarity(text) if use_textblob else np.nan
+    return textblob_score, vader_compound(text)
+
+
+def label_sentiment(positive_mask, negative_mask):
+    """Construye la etiqueta categórica de sentimiento a partir de las máscaras de umbral"""
+    codes = np.select([positive_mask, negative_mask], [0, 1], default=2)
+    return pd.Categorical.from_codes(codes, categories=SENTIMENT_LABELS)
+
+
+def analyze_sentiments(df, use_textblob=False):
+    """Analiza el sentimiento de todos los posts usando VADER (y TextBlob si se solicita)"""
     logger.info("Analizando sentimiento de los posts...")
     
-    # Analizar sentimiento con TextBlob
-    textblob_results = []
-    for text in df['text']:
-        score, label = analyze_sentiment_textblob(text)
-        textblob_results.append((score, label))
+    # Reposts y textos repetidos se analizan una sola vez: se puntúan los textos
+    # únicos (por hash) y el resultado se expande con los códigos de factorize
+    codes, unique_texts = pd.factorize(df['text'].fillna('').astype(str))
+    unique_texts = unique_texts.tolist()
     
-    df['textblob_sentiment'] = [r[0] for r in textblob_results]
-    df['textblob_sentiment_label'] = [r[1] for r in textblob_results]
+    scorer = partial(score_text, use_textblob=use_textblob)
+    if len(unique_texts) >= PARALLEL_MIN_POSTS:
+        # El scoring es CPU-bound y por post: repartirlo entre todos los núcleos
+        with ProcessPoolExecutor() as executor:
+            results = list(executor.map(scorer, unique_texts, chunksize=PARALLEL_CHUNKSIZE))
+    else:
+        results = [scorer(text) for text in unique_texts]
     
-    # Analizar sentimiento con VADER
-    vader_results = []
-    for text in df['text']:
-        score, label = analyze_sentiment_vader(text)
-        vader_results.append((score, label))
+    scores = np.array(results, dtype=np.float64).reshape(len(unique_texts), 2)[codes]
+    textblob_scores = scores[:, 0]
+    vader_scores = scores[:, 1]
     
-    df['vader_sentiment'] = [r[0] for r in vader_results]
-    df['vader_sentiment_label'] = [r[1] for r in vader_results]
+    # Clasificar TextBlob en un único paso vectorizado
+    if use_textblob:
+        df['textblob_sentiment'] = textblob_scores
+        df['textblob_sentiment_label'] = label_sentiment(
+            textblob_scores > POSITIVE_THRESHOLD, textblob_scores < NEGATIVE_THRESHOLD
+        )
+    
+    # Clasificar VADER (umbrales inclusivos)
+    df['vader_sentiment'] = vader_scores
+    df['vader_sentiment_label'] = label_sentiment(
+        vader_scores >= POSITIVE_THRESHOLD, vader_scores <= NEGATIVE_THRESHOLD
+    )
     
     # Conteo de resultados
-    textblob_counts = df['textblob_sentiment_label'].value_counts()
+    if use_textblob:
+        textblob_counts = df['textblob_sentiment_label'].value_counts()
+        logger.info(f"Análisis de sentimiento completado. Resultados TextBlob: {textblob_counts.to_dict()}")
     vader_counts = df['vader_sentiment_label'].value_counts()
-    
-    logger.info(f"Análisis de sentimiento completado. Resultados TextBlob: {textblob_counts.to_dict()}")
     logger.info(f"Análisis de sentimiento completado. Resultados VADER: {vader_counts.to_dict()}")
     
     return df
 
 
-def save_to_database(post_data):
-    """Guarda los posts en la base de datos PostgreSQL"""
-    if not post_data or len(post_data) == 0:
+def save_to_database(df):
+    """Guarda los posts del DataFrame en la base de datos PostgreSQL"""
+    if df is None or df.empty:
         logger.info("No hay posts para guardar")
         return 0
     
-    logger.info(f"Guardando {len(post_data)} posts en la base de datos")
+    logger.info(f"Guardando {len(df)} posts en la base de datos")
     
     try:
         with SessionLocal() as db:
-            # Convertir a DataFrame para facilitar el procesamiento
-            df = pd.DataFrame(post_data)
+            # COPY con ON CONFLICT DO NOTHING: PostgreSQL descarta las URIs ya
+            # existentes usando el índice único, sin consultarlas previamente
+            inserted = bulk_copy(db, TablaPostsBluesky, df.to_dict('records'), conflict_target=[TablaPostsBluesky.uri])
+            db.commit()
             
-            # Verificar URIs existentes para evitar duplicados
-            existing_uris = {}
-            existing_records = db.query(TablaPostsBluesky.uri).all()
-            for record in existing_records:
-                existing_uris[record[0]] = True
-                
-            # Filtrar posts que ya existen en la base de datos
-            new_posts = []
-            for _, row in df.iterrows():
-                if row['uri'] not in existing_uris:
-                    new_post = TablaPostsBluesky(
-                        actor_handle=row['actor_handle'],
-                        uri=row['uri'],
-                        text=row['text'],
-                        created_at=row['created_at'],
-                        likes=row['likes'],
-                        reposts=row['reposts'],
-                        replies=row['replies'],
-                        engagement=row['engagement'],
-                        textblob_sentiment=row['textblob_sentiment'],
-                        textblob_sentiment_label=row['textblob_sentiment_label'],
-                        vader_sentiment=row['vader_sentiment'],
-                        vader_sentiment_label=row['vader_sentiment_label']
-                    )
-                    new_posts.append(new_post)
-            
-            # Añadir nuevos posts a la base de datos
-            if new_posts:
-                db.add_all(new_posts)
-                db.commit()
-                logger.info(f"Se guardaron {len(new_posts)} nuevos posts en la base de datos")
-                return len(new_posts)
+            if inserted:
+                logger.info(f"Se guardaron {inserted} nuevos posts en la base de datos")
             else:
                 logger.info("No se encontraron nuevos posts para guardar")
-                return 0
+            return inserted
                 
     except Exception as e:
         logger.error(f"Error al guardar los posts en la base de datos: {e}")
@@ -381,32 +554,32 @@ def main():
             return
         
         # Buscar actores
-        actor_handles = search_actors(token, SEARCH_TERMS)
+        SESSION.headers.update({"Authorization": f"Bearer {token}"})
+        actor_handles = search_actors(SESSION, args.search_terms)
         if not actor_handles:
             logger.warning("No se encontraron actores, terminando la ejecución")
             return
         
+        # Obtener solo los posts posteriores al último guardado de cada actor
+        latest_dates = get_latest_dates_from_db(actor_handles)
+        
         # Obtener feeds para los actores encontrados
-        all_posts = get_actor_feeds(token, actor_handles, args.limit)
-        if not all_posts:
+        df = get_actor_feeds(SESSION, actor_handles, args.limit, latest_dates)
+        if df.empty:
             logger.warning("No se obtuvieron posts, terminando la ejecución")
             return
         
-        # Convertir a DataFrame
-        df = pd.DataFrame(all_posts)
-        
-        # Filtrar por fecha si se especificó
+        # Filtrar por fecha si se especificó: el slice necesita el índice ordenado por created_at
+        # (ya parseado en UTC). Sin filtro no se ordena: el orden de inserción no importa
         if args.start_date and args.end_date:
-            df = filter_posts_by_date(df, args.start_date, args.end_date)
-        
-        # Ordenar por fecha (más recientes primero)
-        df = df.sort_values(by='created_at', ascending=False)
+            df = df.set_index('created_at', drop=False).sort_index()
+            df = filter_posts_by_date(df, args.start_date, args.end_date).reset_index(drop=True)
         
         # Analizar sentimiento
-        df = analyze_sentiments(df)
+        df = analyze_sentiments(df, use_textblob=(args.sentiment == 'both'))
         
         # Guardar en la base de datos PostgreSQL
-        save_to_database(df.to_dict('records'))
+        save_to_database(df)
         
     except Exception as e:
         logger.error(f"Error durante la ejecución del script: {e}")
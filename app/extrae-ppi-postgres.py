@@ -4,7 +4,8 @@ import argparse
 import logging
 import pandas as pd
 from datetime import datetime, timedelta
-from sqlalchemy import func
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 from ppi_client.ppi import PPI
 from ppi_client.api.constants import (
@@ -12,7 +13,7 @@ from ppi_client.api.constants import (
     ACCOUNTDATA_TYPE_PUSH_NOTIFICATION,
     ACCOUNTDATA_TYPE_ORDER_NOTIFICATION
 )
-from models import SessionLocal, TablaPPI
+from models import SessionLocal, TablaPPI, bulk_copy
 
 # Configuración de logging
 logging.basicConfig(
@@ -34,6 +35,10 @@ DEFAULT_START_DATE = datetime(2025, 1, 1)
 INSTRUMENT_TYPE = "CEDEARS"
 SETTLEMENTS = "A-24HS"
 TICKERS = ["TEND", "AAPLD", "VISTD", "DESPD", "MELID", "XOMD", "NVDAD", "MSFTD", "KOD"]
+DB_COLUMNS = ['Date', 'Price', 'Volume', 'Opening', 'Min', 'Max', 'ticker',
+              'settlement', 'instrument_type', 'currency', 'variacion_diaria']
+CATEGORY_COLUMNS = ['ticker', 'settlement', 'instrument_type', 'currency']
+MAX_WORKERS = 4  # requests simultáneos a la API de PPI (comparten el cliente y su sesión HTTP)
 
 
 def parse_args():
@@ -49,15 +54,35 @@ def parse_args():
         type=lambda s: datetime.strptime(s, '%Y-%m-%d'),
         help="Fecha hasta la cual extraer datos (YYYY-MM-DD). Por defecto: fecha actual"
     )
+    parser.add_argument(
+        "--tickers",
+        nargs="+",
+        default=TICKERS,
+        help=f"Tickers a extraer. Por defecto: {' '.join(TICKERS)}"
+    )
     return parser.parse_args()
 
 
-def get_latest_date_from_db():
+def get_latest_date_from_db(tickers=TICKERS):
     """Obtiene la última fecha disponible en la base de datos"""
     try:
         with SessionLocal() as db:
-            latest_date = db.query(func.max(TablaPPI.Date)).scalar()
+            # La menor de las últimas fechas por ticker: si una ejecución anterior
+            # extrajo solo algunos tickers, los demás no quedan con huecos
+            latest_by_ticker = dict(db.execute(
+                select(TablaPPI.ticker, func.max(TablaPPI.Date))
+                .where(TablaPPI.ticker.in_(tickers))
+                .group_by(TablaPPI.ticker)
+            ).all())
+            
+            # Un ticker sin registros (nuevo en --tickers) necesita toda su historia
+            missing = set(tickers) - set(latest_by_ticker)
+            if missing:
+                if latest_by_ticker:
+                    logger.info(f"Tickers sin datos en la base: {', '.join(sorted(missing))}; se extrae desde {DEFAULT_START_DATE.strftime('%Y-%m-%d')}")
+                return DEFAULT_START_DATE
             
+            latest_date = min(latest_by_ticker.values())
             if latest_date:
                 # Sumamos un día para no duplicar datos
                 next_date = latest_date + timedelta(days=1)
@@ -123,6 +148,17 @@ def extract_ticker_data(ppi, ticker, date_from, date_to):
         return None
 
 
+def optimize_dtypes(df):
+    """Reduce la memoria del DataFrame: enteros al menor tipo posible y textos repetitivos como category"""
+    # Los float no se reducen a float32 para no perder precisión en precios y volúmenes
+    for col in df.select_dtypes(include='integer').columns:
+        df[col] = pd.to_numeric(df[col], downcast='integer')
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
+
 def process_and_save_to_db(df):
     """Procesa y guarda los datos en la base de datos PostgreSQL"""
     if df is None or df.empty:
@@ -132,42 +168,19 @@ def process_and_save_to_db(df):
     try:
         # Convertir fechas
         df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-        df = df.sort_values(by='Date')
+        df = optimize_dtypes(df.sort_values(by='Date'))
         
         # Iniciar sesión de base de datos
         with SessionLocal() as db:
-            # Calcular variación diaria por ticker
-            for ticker in df['ticker'].unique():
-                ticker_mask = df['ticker'] == ticker
-                df.loc[ticker_mask, 'variacion_diaria'] = df.loc[ticker_mask, 'Price'].pct_change() * 100
-            
-            # Verificar registros existentes para evitar duplicados
-            records_added = 0
+            # Calcular variación diaria por ticker (groupby conserva el orden por fecha)
+            df['variacion_diaria'] = df.groupby('ticker')['Price'].pct_change() * 100
             
-            for _, row in df.iterrows():
-                # Verificar si ya existe un registro con la misma fecha y ticker
-                existing = db.query(TablaPPI).filter(
-                    func.date(TablaPPI.Date) == func.date(row['Date']),
-                    TablaPPI.ticker == row['ticker']
-                ).first()
-                
-                if not existing:
-                    # Crear nuevo registro en la base de datos
-                    new_record = TablaPPI(
-                        Date=row['Date'],
-                        Price=row['Price'],
-                        Volume=row['Volume'],
-                        Opening=row['Opening'],
-                        Min=row['Min'],
-                        Max=row['Max'],
-                        ticker=row['ticker'],
-                        settlement=row['settlement'],
-                        instrument_type=row['instrument_type'],
-                        currency=row['currency'],
-                        variacion_diaria=row['variacion_diaria']
-                    )
-                    db.add(new_record)
-                    records_added += 1
+            # COPY con ON CONFLICT DO NOTHING: PostgreSQL descarta los pares
+            # (día, ticker) ya existentes usando el índice único, sin consultarlos
+            records = df[DB_COLUMNS].to_dict(orient='records')
+            records_added = bulk_copy(
+                db, TablaPPI, records, conflict_target=[func.date(TablaPPI.Date), TablaPPI.ticker], binary=True
+            )
             
             # Commit de los cambios a la base de datos
             db.commit()
@@ -186,7 +199,7 @@ def main():
     
     # Determinar fechas de inicio y fin
     date_to = args.hasta if args.hasta else datetime.now()
-    date_from = args.desde if args.desde else get_latest_date_from_db()
+    date_from = args.desde if args.desde else get_latest_date_from_db(args.tickers)
 
     # Validar rango de fechas
     if date_from > date_to:
@@ -200,14 +213,17 @@ def main():
         # Autenticarse con la API
         ppi = authenticate_ppi()
         
-        # Inicializar DataFrame combinado
-        all_data = pd.DataFrame()
+        # Extraer datos para cada ticker: los requests son I/O-bound, se lanzan
+        # en paralelo y se recogen en el orden pedido
+        with ThreadPoolExecutor(max_workers=min(len(args.tickers), MAX_WORKERS)) as executor:
+            results = executor.map(
+                lambda ticker: extract_ticker_data(ppi, ticker, date_from, date_to),
+                args.tickers
+            )
+            frames = [df for df in results if df is not None and not df.empty]
         
-        # Extraer datos para cada ticker
-        for ticker in TICKERS:
-            df = extract_ticker_data(ppi, ticker, date_from, date_to)
-            if df is not None and not df.empty:
-                all_data = pd.concat([all_data, df])
+        # Combinar una sola vez: concatenar dentro del bucle recopia todo en cada vuelta
+        all_data = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
         
         # Guardar resultados en la base de datos
         records_added = process_and_save_to_db(all_data)
@@ -4,6 +4,7 @@ import os
 import argparse
 import logging
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 from ppi_client.ppi import PPI
 from ppi_client.api.constants import (
     ACCOUNTDATA_TYPE_ACCOUNT_NOTIFICATION,
@@ -29,9 +30,13 @@ KEY_PRIVADA = os.environ.get("PPI_KEY_PRIVADA")
 # Constantes
 DEFAULT_START_DATE = datetime(2025, 1, 1)
 CSV_FILE = "market_data.csv"
+CSV_CHUNKSIZE = 50_000  # filas formateadas por bloque al escribir el CSV
+PARQUET_DIR = "market_data_parquet"  # dataset particionado por ticker
 INSTRUMENT_TYPE = "CEDEARS"
 SETTLEMENTS = "A-24HS"
 TICKERS = ["TEND", "AAPLD", "VISTD", "DESPD", "MELID", "XOMD", "NVDAD", "MSFTD", "KOD"]
+CATEGORY_COLUMNS = ['ticker', 'settlement', 'instrument_type', 'currency']
+MAX_WORKERS = 4  # requests simultáneos a la API de PPI (comparten el cliente y su sesión HTTP)
 
 
 def parse_args():
@@ -47,31 +52,66 @@ def parse_args():
         type=lambda s: datetime.strptime(s, '%Y-%m-%d'),
         help="Fecha hasta la cual extraer datos (YYYY-MM-DD). Por defecto: fecha actual"
     )
+    parser.add_argument(
+        "--tickers",
+        nargs="+",
+        default=TICKERS,
+        help=f"Tickers a extraer. Por defecto: {' '.join(TICKERS)}"
+    )
+    parser.add_argument(
+        "--formato",
+        choices=["csv", "parquet"],
+        default="csv",
+        help=f"Formato de almacenamiento: csv ({CSV_FILE}) o parquet particionado por ticker ({PARQUET_DIR}, requiere pyarrow). Por defecto: csv"
+    )
     return parser.parse_args()
 
 
-def get_latest_date_from_csv():
-    """Obtiene la última fecha disponible en el CSV si existe"""
+def read_stored_data(formato, columns):
+    """Lee los datos ya guardados o devuelve None si todavía no hay ninguno"""
+    if formato == 'parquet':
+        # Parquet es columnar: solo se leen las columnas pedidas del disco
+        if os.path.isdir(PARQUET_DIR) and os.listdir(PARQUET_DIR):
+            return pd.read_parquet(PARQUET_DIR, columns=columns)
+    elif os.path.exists(CSV_FILE) and os.path.getsize(CSV_FILE) > 0:
+        # Del CSV también se parsean solo las columnas pedidas
+        return pd.read_csv(CSV_FILE, usecols=columns, dtype={'ticker': 'category'})
+    return None
+
+
+def get_latest_date_from_csv(formato='csv', tickers=TICKERS):
+    """Obtiene la última fecha disponible en el CSV (o dataset parquet) si existe"""
     try:
-        if os.path.exists(CSV_FILE) and os.path.getsize(CSV_FILE) > 0:
-            df = pd.read_csv(CSV_FILE)
-            if not df.empty and 'Date' in df.columns:
-                df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+        df = read_stored_data(formato, columns=['Date', 'ticker'])
+        if df is not None and not df.empty and 'Date' in df.columns:
+            df = df[df['ticker'].isin(tickers)]
+
+            df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+            
+            # Normalizar los datos quitando la información de timezone
+            df['Date'] = df['Date'].dt.tz_localize(None)
+            
+            # Filtra fechas válidas (no futuras)
+            today = datetime.now()
+            valid_dates = df[df['Date'] <= today]
+            
+            if not valid_dates.empty:
+                # La menor de las últimas fechas por ticker: si una ejecución anterior
+                # extrajo solo algunos tickers, los demás no quedan con huecos
+                latest_by_ticker = valid_dates.groupby('ticker', observed=True)['Date'].max()
                 
-                # Normalizar los datos quitando la información de timezone
-                df['Date'] = df['Date'].dt.tz_localize(None)
+                # Un ticker sin registros (nuevo en --tickers) necesita toda su historia
+                missing = set(tickers) - set(latest_by_ticker.index)
+                if missing:
+                    logger.info(f"Tickers sin datos en el archivo: {', '.join(sorted(missing))}; se extrae desde {DEFAULT_START_DATE.strftime('%Y-%m-%d')}")
+                    return DEFAULT_START_DATE
                 
-                # Filtra fechas válidas (no futuras)
-                today = datetime.now()
-                valid_dates = df[df['Date'] <= today]
+                latest_date = latest_by_ticker.min()
+                # Sumamos un día para no duplicar datos
+                next_date = latest_date + timedelta(days=1)
                 
-                if not valid_dates.empty:
-                    latest_date = valid_dates['Date'].max()
-                    # Sumamos un día para no duplicar datos
-                    next_date = latest_date + timedelta(days=1)
-                    
-                    logger.info(f"Última fecha en CSV: {latest_date.strftime('%Y-%m-%d')}")
-                    return next_date
+                logger.info(f"Última fecha en CSV: {latest_date.strftime('%Y-%m-%d')}")
+                return next_date
     
     except Exception as e:
         logger.error(f"Error al leer el CSV existente: {e}")
@@ -132,8 +172,19 @@ def extract_ticker_data(ppi, ticker, date_from, date_to):
         return None
 
 
-def process_and_save_data(df):
-    """Procesa y guarda los datos en el archivo CSV"""
+def optimize_dtypes(df):
+    """Reduce la memoria del DataFrame: enteros al menor tipo posible y textos repetitivos como category"""
+    # Los float no se reducen a float32: precios y volúmenes se guardarían redondeados en el CSV/parquet
+    for col in df.select_dtypes(include='integer').columns:
+        df[col] = pd.to_numeric(df[col], downcast='integer')
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
+
+def process_and_save_data(df, formato='csv'):
+    """Procesa y guarda los datos en el archivo CSV o en el dataset parquet"""
     if df is None or df.empty:
         logger.info("No hay nuevos datos para guardar")
         return 0
@@ -141,44 +192,46 @@ def process_and_save_data(df):
     try:
         # Convertir fechas
         df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
-        df = df.sort_values(by='Date')
+        df = optimize_dtypes(df.sort_values(by='Date'))
         
-        # Si el archivo existe, verificar duplicados
-        if os.path.exists(CSV_FILE) and os.path.getsize(CSV_FILE) > 0:
-            existing_df = pd.read_csv(CSV_FILE)
-            existing_df['Date'] = pd.to_datetime(existing_df['Date'], errors='coerce')
-            
-            # Normalizar los datos quitando la información de timezone para la comparación
-            existing_df_normalized = existing_df.copy()
-            existing_df_normalized['Date'] = existing_df_normalized['Date'].dt.tz_localize(None)
-            
-            df_normalized = df.copy()
-            df_normalized['Date'] = df_normalized['Date'].dt.tz_localize(None)
+        destination = PARQUET_DIR if formato == 'parquet' else CSV_FILE
+        
+        # Si ya hay datos guardados, verificar duplicados
+        existing_df = read_stored_data(formato, columns=['Date', 'ticker'])
+        if existing_df is not None:
+            # Normalizar las fechas quitando la información de timezone para la comparación
+            existing_dates = pd.to_datetime(existing_df['Date'], errors='coerce').dt.tz_localize(None)
+            new_dates = df['Date'].dt.tz_localize(None)
             
-            # Crear una clave única para cada registro usando los dataframes normalizados
-            df_normalized['key'] = df_normalized['Date'].dt.strftime('%Y-%m-%d') + '_' + df_normalized['ticker']
-            existing_df_normalized['key'] = existing_df_normalized['Date'].dt.strftime('%Y-%m-%d') + '_' + existing_df_normalized['ticker']
+            # Clave (día, ticker) como MultiIndex: el anti-join se resuelve por hash,
+            # sin formatear un string por fila
+            existing_keys = pd.MultiIndex.from_arrays(
+                [existing_dates.dt.normalize(), existing_df['ticker'].astype(str)]
+            )
+            new_keys = pd.MultiIndex.from_arrays([new_dates.dt.normalize(), df['ticker']])
             
-            # Filtrar registros que ya existen (usando las claves normalizadas pero manteniendo los datos originales)
-            new_keys = ~df_normalized['key'].isin(existing_df_normalized['key'])
-            df = df.iloc[new_keys.values]
+            # Filtrar registros que ya existen (manteniendo los datos originales)
+            df = df[~new_keys.isin(existing_keys)]
             
             if df.empty:
-                logger.info("Todos los registros ya existen en el CSV")
+                logger.info(f"Todos los registros ya existen en {destination}")
                 return 0
         
         # IMPORTANTE: Estas líneas deben estar fuera del bloque condicional anterior
-        # Calcular variación diaria por ticker
-        for ticker in df['ticker'].unique():
-            ticker_mask = df['ticker'] == ticker
-            df.loc[ticker_mask, 'variacion_diaria'] = df.loc[ticker_mask, 'Price'].pct_change() * 100
+        # Calcular variación diaria por ticker (groupby conserva el orden por fecha)
+        df['variacion_diaria'] = df.groupby('ticker')['Price'].pct_change() * 100
         
-        # Guardar en CSV
-        file_exists = os.path.exists(CSV_FILE) and os.path.getsize(CSV_FILE) > 0
-        df.to_csv(CSV_FILE, mode='a', header=not file_exists, index=False)
+        if formato == 'parquet':
+            # Cada ejecución agrega un archivo nuevo por partición de ticker
+            df.to_parquet(PARQUET_DIR, engine='pyarrow', compression='zstd',
+                          partition_cols=['ticker'], index=False)
+        else:
+            # Guardar en CSV
+            file_exists = os.path.exists(CSV_FILE) and os.path.getsize(CSV_FILE) > 0
+            df.to_csv(CSV_FILE, mode='a', header=not file_exists, index=False, chunksize=CSV_CHUNKSIZE)
         
         records_added = len(df)
-        logger.info(f"{records_added} registros agregados a {CSV_FILE}")
+        logger.info(f"{records_added} registros agregados a {destination}")
         return records_added
             
     except Exception as e:
@@ -192,7 +245,7 @@ def main():
     
     # Determinar fechas de inicio y fin
     date_to = args.hasta if args.hasta else datetime.now()
-    date_from = args.desde if args.desde else get_latest_date_from_csv()
+    date_from = args.desde if args.desde else get_latest_date_from_csv(args.formato, args.tickers)
 
     # Validar rango de fechas
     if date_from > date_to:
@@ -206,17 +259,20 @@ def main():
         # Autenticarse con la API
         ppi = authenticate_ppi()
         
-        # Inicializar DataFrame combinado
-        all_data = pd.DataFrame()
+        # Extraer datos para cada ticker: los requests son I/O-bound, se lanzan
+        # en paralelo y se recogen en el orden pedido
+        with ThreadPoolExecutor(max_workers=min(len(args.tickers), MAX_WORKERS)) as executor:
+            results = executor.map(
+                lambda ticker: extract_ticker_data(ppi, ticker, date_from, date_to),
+                args.tickers
+            )
+            frames = [df for df in results if df is not None and not df.empty]
         
-        # Extraer datos para cada ticker
-        for ticker in TICKERS:
-            df = extract_ticker_data(ppi, ticker, date_from, date_to)
-            if df is not None and not df.empty:
-                all_data = pd.concat([all_data, df])
+        # Combinar una sola vez: concatenar dentro del bucle recopia todo en cada vuelta
+        all_data = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
         
         # Guardar resultados
-        records_added = process_and_save_data(all_data)
+        records_added = process_and_save_data(all_data, args.formato)
         logger.info(f"Extracción finalizada: {records_added} registros nuevos agregados")
     
     except Exception as e:
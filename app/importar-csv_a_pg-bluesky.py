@@ -1,14 +1,20 @@
 #!/usr/bin/env python3
 # filepath: /app/importar-csv_a_pg-bluesky.py
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pv
 from datetime import datetime
 import os
 import logging
 import argparse
+import sys
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from models import SessionLocal, TablaPostsBluesky, init_db
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from models import SessionLocal, TablaPostsBluesky, bulk_copy, init_db
 
 # Configuración de logging
 logging.basicConfig(
@@ -23,10 +29,34 @@ logger = logging.getLogger(__name__)
 
 # Constantes
 DEFAULT_CSV_PATH = "/app/posts_con_sentimiento_historia.csv"
+CSV_BLOCK_SIZE_MB = 32
+MAX_WORKERS = 4  # bloques guardándose en paralelo, cada uno con su propia conexión
+
+# Esquema explícito del CSV: pyarrow no infiere tipos. Los conteos y scores se leen como
+# texto porque el archivo trae valores como "3.0" o vacíos que abortarían la lectura de
+# todo el bloque; prepare_data_for_db los convierte con pd.to_numeric(errors='coerce')
+CSV_COLUMN_TYPES = {
+    'actor_handle': pa.string(),
+    'uri': pa.string(),
+    'text': pa.string(),
+    'created_at': pa.string(),
+    'likes': pa.string(),
+    'reposts': pa.string(),
+    'replies': pa.string(),
+    'engagement': pa.string(),
+    'sentiment': pa.string(),
+    'sentiment_vader': pa.string(),
+    'interpretacion_sentimiento': pa.string(),
+}
+
+DB_COLUMNS = ['actor_handle', 'uri', 'text', 'created_at', 'likes', 'reposts', 'replies', 'engagement',
+              'textblob_sentiment', 'textblob_sentiment_label', 'vader_sentiment', 'vader_sentiment_label']
+STRING_COLUMNS = ['actor_handle', 'uri', 'text', 'textblob_sentiment_label', 'vader_sentiment_label']
 
 # Umbrales de sentimiento
 POSITIVE_THRESHOLD = 0.05
 NEGATIVE_THRESHOLD = -0.05
+SENTIMENT_LABELS = ['Positivo', 'Negativo', 'Neutral']
 
 
 def parse_args():
@@ -51,80 +81,97 @@ def parse_args():
         default=1000, 
         help='Número de registros a procesar por lote. Por defecto: 1000'
     )
+    parser.add_argument(
+        '--block-size-mb',
+        type=int,
+        default=CSV_BLOCK_SIZE_MB,
+        help=f'Tamaño en MB de cada bloque del CSV a leer. Por defecto: {CSV_BLOCK_SIZE_MB}'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=MAX_WORKERS,
+        help=f'Número de bloques a guardar en paralelo en la base de datos. Por defecto: {MAX_WORKERS}'
+    )
     return parser.parse_args()
 
 
-def read_csv_file(csv_path):
-    """Lee el archivo CSV y convierte los datos a un DataFrame"""
-    logger.info(f"Leyendo archivo CSV: {csv_path}")
+def read_csv_file(csv_path, block_size_mb=CSV_BLOCK_SIZE_MB, start_date_str=None, end_date_str=None):
+    """Lee el archivo CSV por bloques y devuelve cada bloque como DataFrame con las fechas convertidas"""
+    logger.info(f"Leyendo archivo CSV: {csv_path} en bloques de {block_size_mb} MB")
     
     try:
-        df = pd.read_csv(csv_path)
-        logger.info(f"Archivo CSV leído: {len(df)} registros encontrados")
-        
-        # Convertir fecha a datetime usando un método más robusto
-        try:
-            # Intentar usar pd.to_datetime con format='mixed' para detectar el formato automáticamente
-            df['created_at'] = pd.to_datetime(df['created_at'], format='mixed', utc=True)
-        except:
-            # Si falla, intentar convertir cada fecha individualmente
-            logger.info("Intentando convertir fechas manualmente...")
-            created_at_list = []
-            for date_str in df['created_at']:
-                try:
-                    # Probar varios formatos comunes
-                    dt = pd.to_datetime(date_str, utc=True)
-                except:
-                    logger.warning(f"No se pudo convertir la fecha: {date_str}, usando None")
-                    dt = None
-                created_at_list.append(dt)
-            df['created_at'] = created_at_list
-        
-        # Filtrar filas con fechas inválidas
-        valid_rows = df['created_at'].notna()
-        if not all(valid_rows):
-            logger.warning(f"Se encontraron {(~valid_rows).sum()} filas con fechas inválidas que serán eliminadas")
-            df = df[valid_rows]
-        
-        # Extraer fecha de created_at si no existe la columna 'date'
-        if 'date' not in df.columns:
-            df['date'] = df['created_at'].dt.date
-        
-        logger.info(f"Archivo CSV procesado correctamente. Total de registros válidos: {len(df)}")
-        return df
+        # Lector de pyarrow en streaming: parsea en varios hilos con el esquema fijo y la
+        # memoria queda acotada a un bloque y no al archivo entero. Los textos de los posts
+        # traen saltos de línea entre comillas: sin newlines_in_values el corte de bloques
+        # pierde la sincronía con el parser
+        reader = pv.open_csv(
+            csv_path,
+            read_options=pv.ReadOptions(use_threads=True, block_size=block_size_mb << 20),
+            parse_options=pv.ParseOptions(newlines_in_values=True),
+            convert_options=pv.ConvertOptions(column_types=CSV_COLUMN_TYPES, strings_can_be_null=True)
+        )
+        for chunk_number, batch in enumerate(reader, start=1):
+            logger.info(f"Bloque {chunk_number} leído: {batch.num_rows} registros encontrados")
+            
+            # Filtrar por fecha antes de pasar a pandas: las filas fuera del rango nunca se materializan
+            if start_date_str and end_date_str:
+                batch = filter_posts_by_date(batch, start_date_str, end_date_str)
+            
+            yield parse_dates(batch.to_pandas())
     except Exception as e:
+        # Se propaga: cortar la lectura en silencio dejaría el resto del archivo sin importar
         logger.error(f"Error al leer el archivo CSV: {e}")
-        return None
+        raise
 
 
-def filter_posts_by_date(df, start_date_str, end_date_str):
-    """Filtra posts por rango de fechas"""
+def parse_dates(df):
+    """Convierte created_at a datetime y descarta las filas con fechas inválidas"""
+    # Las fechas de Bluesky son ISO 8601 (con o sin fracción de segundo y zona): format='ISO8601'
+    # usa el parser rápido de pandas y las que no se puedan convertir quedan como NaT.
+    # Si filter_posts_by_date ya las convirtió, el bloque llega con la columna tipada
+    if not pd.api.types.is_datetime64_any_dtype(df['created_at']):
+        df['created_at'] = pd.to_datetime(df['created_at'], format='ISO8601', utc=True, errors='coerce')
+    
+    # Filtrar filas con fechas inválidas
+    valid_rows = df['created_at'].notna()
+    if not all(valid_rows):
+        logger.warning(f"Se encontraron {(~valid_rows).sum()} filas con fechas inválidas que serán eliminadas")
+        df = df[valid_rows]
+    
+    # Extraer fecha de created_at si no existe la columna 'date'
+    if 'date' not in df.columns:
+        df['date'] = df['created_at'].dt.date
+    
+    return df
+
+
+def filter_posts_by_date(batch, start_date_str, end_date_str):
+    """Filtra por rango de fechas un bloque de Arrow leído del CSV"""
     logger.info(f"Filtrando posts entre {start_date_str} y {end_date_str}")
     
     try:
-        if not pd.api.types.is_datetime64_any_dtype(df['created_at']):
-            df['created_at'] = pd.to_datetime(df['created_at'])
-        
-        if df['created_at'].dt.tz is None:
-            df['created_at'] = df['created_at'].dt.tz_localize('UTC')
+        start_date = pd.Timestamp(start_date_str, tz='UTC')
+        end_date = pd.Timestamp(end_date_str, tz='UTC') + pd.Timedelta(days=1) - pd.Timedelta(1, unit='ns')
         
-        start_date = pd.to_datetime(start_date_str + ' 00:00:00+00:00')
-        end_date = pd.to_datetime(end_date_str + ' 23:59:59+00:00')
+        # Solo se convierte la columna created_at; el resto del bloque se filtra en Arrow.
+        # La columna convertida (timestamp UTC) reemplaza al texto: parse_dates no la vuelve a parsear
+        created_at = pd.to_datetime(batch.column('created_at').to_pandas(), format='ISO8601', utc=True, errors='coerce')
+        batch = batch.set_column(batch.schema.get_field_index('created_at'), 'created_at', pa.array(created_at))
+        filtered_batch = batch.filter(pa.array(created_at.between(start_date, end_date).to_numpy()))
+        logger.info(f"Posts después del filtrado: {filtered_batch.num_rows} (de {batch.num_rows} posts originales)")
         
-        filtered_df = df[(df['created_at'] >= start_date) & (df['created_at'] <= end_date)].copy()
-        logger.info(f"Posts después del filtrado: {len(filtered_df)} (de {len(df)} posts originales)")
-        
-        return filtered_df
+        return filtered_batch
     except Exception as e:
         logger.error(f"Error al filtrar posts por fecha: {e}")
-        return df
+        return batch
 
 
 def get_latest_date_from_db():
     """Obtiene la fecha más reciente de los posts almacenados en la base de datos"""
     try:
         with SessionLocal() as db:
-            latest_date = db.query(func.max(TablaPostsBluesky.created_at)).scalar()
+            latest_date = db.execute(select(func.max(TablaPostsBluesky.created_at))).scalar()
             if latest_date:
                 logger.info(f"Último post en la base de datos: {latest_date.strftime('%Y-%m-%d %H:%M:%S')}")
             else:
@@ -135,11 +182,31 @@ def get_latest_date_from_db():
         return None
 
 
+def to_int32(series):
+    """Convierte una columna de conteos a int32, coercionando solo si no viene ya como entero"""
+    if pd.api.types.is_integer_dtype(series):
+        return series.astype('int32', copy=False)
+    return pd.to_numeric(series, errors='coerce').fillna(0).astype('int32')
+
+
+def label_sentiment(positive_mask, negative_mask):
+    """Construye la etiqueta categórica de sentimiento a partir de las máscaras de umbral"""
+    codes = np.select([positive_mask, negative_mask], [0, 1], default=2)
+    return pd.Categorical.from_codes(codes, categories=SENTIMENT_LABELS)
+
+
 def prepare_data_for_db(df):
     """Prepara los datos del CSV para la estructura de la base de datos"""
     logger.info("Preparando datos para importar a la base de datos...")
     
     try:
+        # URIs repetidas dentro del bloque: se queda la última aparición (métricas más recientes)
+        # antes de preparar columnas y de mandar nada a la base
+        total_rows = len(df)
+        df = df.drop_duplicates(subset=['uri'], keep='last')
+        if len(df) < total_rows:
+            logger.info(f"Se descartaron {total_rows - len(df)} posts con URI duplicada en el CSV")
+        
         # Mapeo de columnas CSV a columnas de la base de datos
         db_df = pd.DataFrame()
         
@@ -149,70 +216,58 @@ def prepare_data_for_db(df):
         db_df['text'] = df['text']
         db_df['created_at'] = df['created_at']
         
-        # Asegurar que los campos numéricos son realmente números
-        db_df['likes'] = pd.to_numeric(df['likes'], errors='coerce').fillna(0).astype(int)
-        db_df['reposts'] = pd.to_numeric(df['reposts'], errors='coerce').fillna(0).astype(int)
-        db_df['replies'] = pd.to_numeric(df['replies'], errors='coerce').fillna(0).astype(int)
+        # Asegurar que los campos numéricos son realmente números (vacíos y valores inválidos quedan en 0)
+        db_df['likes'] = to_int32(df['likes'])
+        db_df['reposts'] = to_int32(df['reposts'])
+        db_df['replies'] = to_int32(df['replies'])
         
         # Columna engagement (puede estar en el CSV o calcularse)
         if 'engagement' in df.columns:
-            db_df['engagement'] = pd.to_numeric(df['engagement'], errors='coerce').fillna(0).astype(int)
+            db_df['engagement'] = to_int32(df['engagement'])
         else:
-            db_df['engagement'] = db_df['likes'] + db_df['reposts'] + db_df['replies']
+            # Suma acumulada sobre un único buffer: sin arrays intermedios en bloques grandes
+            engagement = db_df['likes'].to_numpy().copy()
+            np.add(engagement, db_df['reposts'].to_numpy(), out=engagement)
+            np.add(engagement, db_df['replies'].to_numpy(), out=engagement)
+            db_df['engagement'] = engagement
         
         # Mapeo de columnas de sentimiento
         if 'sentiment' in df.columns:
             db_df['textblob_sentiment'] = pd.to_numeric(df['sentiment'], errors='coerce').fillna(0).astype(float)
-            
-            # Determinar etiqueta basada en el valor del sentimiento
-            textblob_labels = []
-            for sentiment in db_df['textblob_sentiment']:
-                if sentiment > POSITIVE_THRESHOLD:
-                    label = 'Positivo'
-                elif sentiment < NEGATIVE_THRESHOLD:
-                    label = 'Negativo'
-                else:
-                    label = 'Neutral'
-                textblob_labels.append(label)
-            
-            db_df['textblob_sentiment_label'] = textblob_labels
         else:
             db_df['textblob_sentiment'] = 0.0
-            db_df['textblob_sentiment_label'] = 'Neutral'
+        
+        # Determinar etiqueta basada en el valor del sentimiento
+        sentiment = db_df['textblob_sentiment'].to_numpy()
+        db_df['textblob_sentiment_label'] = label_sentiment(
+            sentiment > POSITIVE_THRESHOLD, sentiment < NEGATIVE_THRESHOLD
+        )
         
         # Mapeo de columnas de sentimiento VADER
         if 'sentiment_vader' in df.columns:
             db_df['vader_sentiment'] = pd.to_numeric(df['sentiment_vader'], errors='coerce').fillna(0).astype(float)
-            
-            # Determinar etiqueta basada en el valor del sentimiento de VADER
-            vader_labels = []
-            for sentiment in db_df['vader_sentiment']:
-                if sentiment >= POSITIVE_THRESHOLD:
-                    label = 'Positivo'
-                elif sentiment <= NEGATIVE_THRESHOLD:
-                    label = 'Negativo'
-                else:
-                    label = 'Neutral'
-                vader_labels.append(label)
-            
-            db_df['vader_sentiment_label'] = vader_labels
         else:
             db_df['vader_sentiment'] = 0.0
-            db_df['vader_sentiment_label'] = 'Neutral'
+        
+        # Determinar etiqueta basada en el valor del sentimiento de VADER (umbrales inclusivos)
+        sentiment = db_df['vader_sentiment'].to_numpy()
+        db_df['vader_sentiment_label'] = label_sentiment(
+            sentiment >= POSITIVE_THRESHOLD, sentiment <= NEGATIVE_THRESHOLD
+        )
         
         # Si hay interpretación directa, usarla para sobreescribir las etiquetas generadas
         if 'interpretacion_sentimiento' in df.columns:
-            for i, interp in enumerate(df['interpretacion_sentimiento']):
-                if pd.notna(interp):
-                    if 'Positivo' in str(interp):
-                        db_df.at[i, 'textblob_sentiment_label'] = 'Positivo'
-                        db_df.at[i, 'vader_sentiment_label'] = 'Positivo'
-                    elif 'Negativo' in str(interp):
-                        db_df.at[i, 'textblob_sentiment_label'] = 'Negativo'
-                        db_df.at[i, 'vader_sentiment_label'] = 'Negativo'
-                    elif 'Neutral' in str(interp):
-                        db_df.at[i, 'textblob_sentiment_label'] = 'Neutral'
-                        db_df.at[i, 'vader_sentiment_label'] = 'Neutral'
+            # Se trabaja sobre arrays (por posición), así el índice de df no importa aunque venga filtrado
+            interp = df['interpretacion_sentimiento'].astype(str)
+            override = np.select(
+                [interp.str.contains(label, na=False).to_numpy() for label in SENTIMENT_LABELS],
+                [0, 1, 2],
+                default=-1
+            )
+            has_override = override >= 0
+            for col in ('textblob_sentiment_label', 'vader_sentiment_label'):
+                codes = np.where(has_override, override, db_df[col].cat.codes.to_numpy())
+                db_df[col] = pd.Categorical.from_codes(codes, categories=SENTIMENT_LABELS)
         
         logger.info(f"Datos preparados correctamente. Total de registros: {len(db_df)}")
         return db_df
@@ -221,6 +276,22 @@ def prepare_data_for_db(df):
         return None
 
 
+def to_db_frame(df):
+    """Deja solo las columnas de la tabla, con los textos convertidos a str"""
+    # Mismo criterio que str(valor) fila por fila, con cualquier versión de pandas
+    return df[DB_COLUMNS].assign(**{col: df[col].map(str) for col in STRING_COLUMNS})
+
+
+def to_db_records(batch_df):
+    """Convierte un lote del DataFrame en diccionarios listos para el INSERT"""
+    return to_db_frame(batch_df).to_dict('records')
+
+
+def copy_to_database(db, df):
+    """Carga los posts con COPY omitiendo las URIs existentes"""
+    return bulk_copy(db, TablaPostsBluesky, to_db_records(df), conflict_target=[TablaPostsBluesky.uri])
+
+
 def save_to_database(df, batch_size=1000):
     """Guarda los posts en la base de datos PostgreSQL por lotes"""
     if df is None or len(df) == 0:
@@ -233,14 +304,24 @@ def save_to_database(df, batch_size=1000):
     total_saved = 0
     
     try:
+        # INSERT ... ON CONFLICT DO NOTHING: PostgreSQL descarta las URIs ya
+        # existentes (o repetidas en el CSV) usando el índice único
+        stmt = (
+            insert(TablaPostsBluesky)
+            .on_conflict_do_nothing(index_elements=['uri'])
+            .returning(TablaPostsBluesky.id)
+        )
+        
         with SessionLocal() as db:
-            # Obtener URIs existentes para evitar duplicados
-            existing_uris = set()
-            existing_records = db.query(TablaPostsBluesky.uri).all()
-            for record in existing_records:
-                existing_uris.add(record[0])
-                
-            logger.info(f"Se encontraron {len(existing_uris)} posts existentes en la base de datos")
+            # Camino rápido: COPY FROM STDIN de todo el bloque en una sola transacción
+            try:
+                total_saved = copy_to_database(db, df)
+                db.commit()
+                logger.info(f"Importación completada con COPY. Total de posts guardados: {total_saved}/{total_posts}")
+                return total_saved
+            except Exception as e:
+                db.rollback()
+                logger.warning(f"No se pudo cargar con COPY, se insertará por lotes: {e}")
             
             # Procesar lotes de datos
             for start_idx in range(0, total_posts, batch_size):
@@ -249,61 +330,33 @@ def save_to_database(df, batch_size=1000):
                 
                 logger.info(f"Procesando lote {start_idx//batch_size + 1}/{(total_posts//batch_size) + 1} ({start_idx} a {end_idx-1})")
                 
-                # Filtrar posts que ya existen en la base de datos
-                new_posts = []
+                records = to_db_records(batch_df)
                 
-                for _, row in batch_df.iterrows():
-                    uri = row['uri']
-                    if uri not in existing_uris:
-                        # Asegurarnos de que los valores numéricos son del tipo correcto
+                # Añadir nuevos posts a la base de datos: un INSERT con todos los registros del lote
+                try:
+                    inserted = len(db.execute(stmt, records).all())
+                    db.commit()
+                    if inserted:
+                        logger.info(f"Se guardaron {inserted} nuevos posts en el lote")
+                    else:
+                        logger.info("No se encontraron nuevos posts para guardar en este lote")
+                    total_saved += inserted
+                except Exception as e:
+                    db.rollback()
+                    logger.error(f"Error al guardar el lote en la base de datos: {e}")
+                    
+                    # Intentar insertar uno por uno para identificar registros problemáticos
+                    successful_inserts = 0
+                    for record in records:
                         try:
-                            new_post = TablaPostsBluesky(
-                                actor_handle=str(row['actor_handle']),
-                                uri=str(uri),
-                                text=str(row['text']),
-                                created_at=row['created_at'],
-                                likes=int(row['likes']),
-                                reposts=int(row['reposts']),
-                                replies=int(row['replies']),
-                                engagement=int(row['engagement']),
-                                textblob_sentiment=float(row['textblob_sentiment']),
-                                textblob_sentiment_label=str(row['textblob_sentiment_label']),
-                                vader_sentiment=float(row['vader_sentiment']),
-                                vader_sentiment_label=str(row['vader_sentiment_label'])
-                            )
-                            new_posts.append(new_post)
-                            # Actualizar el conjunto de URIs existentes para evitar duplicados en lotes siguientes
-                            existing_uris.add(uri)
-                        except Exception as e:
-                            logger.warning(f"Error al crear objeto para URI {uri}: {e}")
-                
-                # Añadir nuevos posts a la base de datos
-                if new_posts:
-                    try:
-                        db.add_all(new_posts)
-                        db.commit()
-                        logger.info(f"Se guardaron {len(new_posts)} nuevos posts en el lote")
-                        total_saved += len(new_posts)
-                    except Exception as e:
-                        db.rollback()
-                        logger.error(f"Error al guardar el lote en la base de datos: {e}")
-                        
-                        # Intentar insertar uno por uno para identificar registros problemáticos
-                        successful_inserts = 0
-                        for post in new_posts:
-                            try:
-                                db.add(post)
-                                db.commit()
-                                successful_inserts += 1
-                                # Mantenemos la URI en el conjunto para evitar duplicados
-                            except Exception as e_individual:
-                                db.rollback()
-                                logger.warning(f"Error al insertar post individual {post.uri}: {e_individual}")
-                        
-                        logger.info(f"Se guardaron {successful_inserts} posts individuales después del error")
-                        total_saved += successful_inserts
-                else:
-                    logger.info("No se encontraron nuevos posts para guardar en este lote")
+                            successful_inserts += len(db.execute(stmt, [record]).all())
+                            db.commit()
+                        except Exception as e_individual:
+                            db.rollback()
+                            logger.warning(f"Error al insertar post individual {record['uri']}: {e_individual}")
+                    
+                    logger.info(f"Se guardaron {successful_inserts} posts individuales después del error")
+                    total_saved += successful_inserts
             
             logger.info(f"Importación completada. Total de posts guardados: {total_saved}/{total_posts}")
             return total_saved
@@ -330,31 +383,41 @@ def main():
             logger.error(f"El archivo CSV no existe: {csv_path}")
             return
         
-        df = read_csv_file(csv_path)
-        if df is None:
-            logger.error("No se pudo leer el archivo CSV")
-            return
-        
-        # Filtrar por fecha si se especificó
-        if args.start_date and args.end_date:
-            df = filter_posts_by_date(df, args.start_date, args.end_date)
+        # Procesar el CSV bloque a bloque: este hilo lee y prepara mientras otros guardan
+        # los bloques anteriores (cada save_to_database abre su propia sesión)
+        posts_saved = 0
+        chunks_read = 0
+        pending = set()
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            # Si se especificó un rango de fechas, read_csv_file ya entrega los bloques filtrados
+            for df in read_csv_file(csv_path, args.block_size_mb, args.start_date, args.end_date):
+                chunks_read += 1
+                
+                # Preparar datos para la base de datos
+                db_df = prepare_data_for_db(df)
+                if db_df is None:
+                    logger.error(f"No se pudieron preparar los datos del bloque {chunks_read} para la base de datos")
+                    continue
+                
+                # No acumular más bloques que hilos: la memoria sigue acotada
+                if len(pending) >= args.workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    posts_saved += sum(future.result() for future in done)
+                
+                # Guardar en la base de datos PostgreSQL (ON CONFLICT hace innecesario ordenar todo el archivo)
+                pending.add(executor.submit(save_to_database, db_df, args.batch_size))
+            
+            posts_saved += sum(future.result() for future in pending)
         
-        # Preparar datos para la base de datos
-        db_df = prepare_data_for_db(df)
-        if db_df is None:
-            logger.error("No se pudieron preparar los datos para la base de datos")
+        if chunks_read == 0:
+            logger.error("No se pudo leer el archivo CSV")
             return
         
-        # Ordenar por fecha (más recientes primero)
-        db_df = db_df.sort_values(by='created_at', ascending=False)
-        
-        # Guardar en la base de datos PostgreSQL
-        posts_saved = save_to_database(db_df, args.batch_size)
-        
         logger.info(f"Proceso finalizado. Se importaron {posts_saved} posts nuevos.")
         
     except Exception as e:
         logger.error(f"Error durante la ejecución del script: {e}")
+        sys.exit(1)
 
 
 if __name__ == "__main__":
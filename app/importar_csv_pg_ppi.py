@@ -4,9 +4,10 @@ import argparse
 import logging
 import pandas as pd
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from sqlalchemy import func
 from sqlalchemy.orm import Session
-from models import SessionLocal, TablaPPI
+from models import SessionLocal, TablaPPI, bulk_copy
 
 # Configuración de logging
 logging.basicConfig(
@@ -19,6 +20,11 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+DB_COLUMNS = ['Date', 'Price', 'Volume', 'Opening', 'Min', 'Max', 'ticker',
+              'settlement', 'instrument_type', 'currency', 'variacion_diaria']
+BATCH_SIZE = 10_000  # registros por COPY y commit
+MAX_WORKERS = 4  # lotes insertados en paralelo, cada uno con su propia conexión
+
 def parse_args():
     """Parsea los argumentos de línea de comandos"""
     parser = argparse.ArgumentParser(description="Importa datos desde un archivo CSV a la tabla tabla_ppi en PostgreSQL")
@@ -70,8 +76,8 @@ def process_dataframe(df):
             logger.warning("No hay datos para procesar")
             return None
             
-        # Convertir fechas
-        df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
+        # Convertir fechas (ISO 8601, con o sin hora): parser rápido sin inferir el formato
+        df['Date'] = pd.to_datetime(df['Date'], format='ISO8601', errors='coerce')
         
         # Convertir columnas numéricas
         numeric_cols = ['Price', 'Volume', 'Opening', 'Min', 'Max', 'variacion_diaria']
@@ -83,9 +89,6 @@ def process_dataframe(df):
         if invalid_dates > 0:
             logger.warning(f"Se eliminaron {invalid_dates} filas con fechas inválidas")
             df = df.dropna(subset=['Date'])
-            
-        # Ordenar por fecha
-        df = df.sort_values(by=['ticker', 'Date'])
         
         logger.info(f"DataFrame procesado correctamente: {len(df)} filas válidas")
         return df
@@ -94,6 +97,15 @@ def process_dataframe(df):
         logger.error(f"Error al procesar el DataFrame: {e}")
         return None
 
+def insert_batch(batch, skip_duplicates=True):
+    """Carga un lote con COPY en su propia sesión y devuelve cuántos registros se agregaron"""
+    with SessionLocal() as db:
+        # Índice único por día y ticker (uq_tabla_ppi_dia_ticker)
+        conflict_target = [func.date(TablaPPI.Date), TablaPPI.ticker] if skip_duplicates else None
+        records_added = bulk_copy(db, TablaPPI, batch, conflict_target=conflict_target, binary=True)
+        db.commit()
+        return records_added
+
 def import_to_database(df, skip_duplicates=True):
     """Importa los datos del DataFrame a la base de datos"""
     if df is None or df.empty:
@@ -101,52 +113,24 @@ def import_to_database(df, skip_duplicates=True):
         return 0
         
     try:
-        # Iniciar sesión de base de datos
-        with SessionLocal() as db:
-            records_added = 0
-            records_skipped = 0
-            
-            # Procesar cada fila
-            for _, row in df.iterrows():
-                # Verificar si el registro ya existe
-                if skip_duplicates:
-                    existing = db.query(TablaPPI).filter(
-                        func.date(TablaPPI.Date) == func.date(row['Date']),
-                        TablaPPI.ticker == row['ticker']
-                    ).first()
-                    
-                    if existing:
-                        records_skipped += 1
-                        continue
-                
-                # Crear nuevo registro
-                new_record = TablaPPI(
-                    Date=row['Date'],
-                    Price=row['Price'],
-                    Volume=row['Volume'],
-                    Opening=row['Opening'],
-                    Min=row['Min'],
-                    Max=row['Max'],
-                    ticker=row['ticker'],
-                    settlement=row['settlement'],
-                    instrument_type=row['instrument_type'],
-                    currency=row['currency'],
-                    variacion_diaria=row['variacion_diaria']
-                )
-                
-                db.add(new_record)
-                records_added += 1
-                
-                # Hacer commit cada 100 registros para evitar transacciones muy grandes
-                if records_added % 100 == 0:
-                    db.commit()
-                    logger.info(f"Progreso: {records_added} registros importados")
-            
-            # Commit final
-            db.commit()
-            
-            logger.info(f"Importación completada: {records_added} registros agregados, {records_skipped} registros omitidos")
-            return records_added
+        records_added = 0
+        
+        # Con skip_duplicates, ON CONFLICT DO NOTHING: PostgreSQL descarta los pares
+        # (día, ticker) ya existentes usando el índice único, sin consultarlos
+        # Cargar por lotes grandes: un COPY y un commit (y un fsync del WAL) cada BATCH_SIZE registros
+        records = df[DB_COLUMNS].to_dict('records')
+        batches = [records[start:start + BATCH_SIZE] for start in range(0, len(records), BATCH_SIZE)]
+        
+        # Los lotes se envían en paralelo, cada uno en su sesión: la espera de red de uno
+        # se solapa con el envío de los demás
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            for batch_added in executor.map(lambda batch: insert_batch(batch, skip_duplicates), batches):
+                records_added += batch_added
+                logger.info(f"Progreso: {records_added} registros importados")
+        
+        records_skipped = len(records) - records_added
+        logger.info(f"Importación completada: {records_added} registros agregados, {records_skipped} registros omitidos")
+        return records_added
             
     except Exception as e:
         logger.error(f"Error al importar datos a la base de datos: {e}")
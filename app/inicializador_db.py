@@ -10,6 +10,7 @@ import logging
 import os
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import insert
 
 # Importar los modelos desde app.models
 from models import (
@@ -28,72 +29,21 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def populate_tipo_usuarios(db: Session):
-    """
-    Puebla la tabla tipo_usuarios con datos predefinidos.
-    """
-    logger.info("Poblando tabla tipo_usuarios...")
-    tipo_usuarios_data = [
+# Datos estáticos de las tablas de referencia: (modelo, clave primaria, registros)
+SEED_DATA = [
+    (TipoUsuario, "cod_tipo_usuario", [
         {"cod_tipo_usuario": "news_ext", "descripcion": "Noticias externas"},
         {"cod_tipo_usuario": "news_local", "descripcion": "Noticias locales"},
         {"cod_tipo_usuario": "others", "descripcion": "Otros"},
         {"cod_tipo_usuario": "influencers", "descripcion": "Influencers"},
-    ]
-
-    try:
-        added_count = 0
-        for data in tipo_usuarios_data:
-            existing_tipo = db.query(TipoUsuario).filter_by(cod_tipo_usuario=data["cod_tipo_usuario"]).first()
-            if not existing_tipo:
-                nuevo_tipo = TipoUsuario(**data)
-                db.add(nuevo_tipo)
-                added_count += 1
-        
-        if added_count > 0:
-            db.commit()
-            logger.info(f"Tabla tipo_usuarios poblada exitosamente. Se añadieron {added_count} registros.")
-        else:
-            logger.info("No fue necesario añadir nuevos tipos de usuario.")
-    except Exception as e:
-        db.rollback()
-        logger.error(f"Error al poblar la tabla tipo_usuarios: {e}", exc_info=True)
-
-def populate_tipo_notas(db: Session):
-    """
-    Puebla la tabla tipo_notas con datos predefinidos.
-    """
-    logger.info("Poblando tabla tipo_notas...")
-    tipo_notas_data = [
+    ]),
+    (TipoNota, "cod_tipo_nota", [
         {"cod_tipo_nota": 1, "descripcion": "Texto"},
         {"cod_tipo_nota": 2, "descripcion": "Imagen"},
         {"cod_tipo_nota": 3, "descripcion": "Video"},
         {"cod_tipo_nota": 4, "descripcion": "Enlace"},
-    ]
-
-    try:
-        added_count = 0
-        for data in tipo_notas_data:
-            existing_tipo = db.query(TipoNota).filter_by(cod_tipo_nota=data["cod_tipo_nota"]).first()
-            if not existing_tipo:
-                nuevo_tipo = TipoNota(**data)
-                db.add(nuevo_tipo)
-                added_count += 1
-        
-        if added_count > 0:
-            db.commit()
-            logger.info(f"Tabla tipo_notas poblada exitosamente. Se añadieron {added_count} registros.")
-        else:
-            logger.info("No fue necesario añadir nuevos tipos de notas.")
-    except Exception as e:
-        db.rollback()
-        logger.error(f"Error al poblar la tabla tipo_notas: {e}", exc_info=True)
-
-def populate_paises(db: Session):
-    """
-    Puebla la tabla paises con algunos datos básicos.
-    """
-    logger.info("Poblando tabla paises...")
-    paises_data = [
+    ]),
+    (Paises, "cod_pais", [
         {"cod_pais": "AR", "descripcion": "Argentina"},
         {"cod_pais": "US", "descripcion": "Estados Unidos"},
         {"cod_pais": "GB", "descripcion": "Reino Unido"},
@@ -104,25 +54,26 @@ def populate_paises(db: Session):
         {"cod_pais": "UY", "descripcion": "Uruguay"},
         {"cod_pais": "CO", "descripcion": "Colombia"},
         {"cod_pais": "PE", "descripcion": "Perú"},
-    ]
+    ]),
+]
 
-    try:
-        added_count = 0
-        for data in paises_data:
-            existing_pais = db.query(Paises).filter_by(cod_pais=data["cod_pais"]).first()
-            if not existing_pais:
-                nuevo_pais = Paises(**data)
-                db.add(nuevo_pais)
-                added_count += 1
-        
-        if added_count > 0:
-            db.commit()
-            logger.info(f"Tabla paises poblada exitosamente. Se añadieron {added_count} registros.")
-        else:
-            logger.info("No fue necesario añadir nuevos países.")
-    except Exception as e:
-        db.rollback()
-        logger.error(f"Error al poblar la tabla paises: {e}", exc_info=True)
+def seed_table(db: Session, model, pk_col, rows):
+    """
+    Puebla una tabla de referencia con un único INSERT, sin hacer commit.
+    """
+    table_name = model.__tablename__
+    logger.info(f"Poblando tabla {table_name}...")
+    
+    # Las claves ya existentes las descarta PostgreSQL por la clave primaria
+    result = db.execute(
+        insert(model).values(rows).on_conflict_do_nothing(index_elements=[pk_col])
+    )
+    
+    if result.rowcount > 0:
+        logger.info(f"Tabla {table_name} poblada exitosamente. Se añadieron {result.rowcount} registros.")
+    else:
+        logger.info(f"No fue necesario añadir nuevos registros a {table_name}.")
+    return result.rowcount
 
 def init_database():
     """
@@ -139,10 +90,14 @@ def init_database():
         # Crear sesión de base de datos
         db = SessionLocal()
         try:
-            # Poblar tablas de referencia
-            populate_tipo_usuarios(db)
-            populate_tipo_notas(db)
-            populate_paises(db)
+            # Poblar tablas de referencia en una sola transacción
+            try:
+                for model, pk_col, rows in SEED_DATA:
+                    seed_table(db, model, pk_col, rows)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Error al poblar las tablas de referencia: {e}", exc_info=True)
             
             logger.info("Inicialización de base de datos completada exitosamente.")
         finally:
@@ -3,13 +3,14 @@
 # Procesa lotes de notas usando Ollama (gemma3:12b) con JSON Schema y reintentos
 
 import os
-import json
+import orjson
 import logging
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from ollama import Client
 from jsonschema import validate, ValidationError
 from sqlalchemy.orm import Session
-from models import SessionLocal, NotasXUsuario, NotasXUsuarioGemma
+from models import SessionLocal, NotasXUsuario, NotasXUsuarioGemma, TICKER_BITS
 
 # ▶ Logging
 logging.basicConfig(
@@ -24,6 +25,10 @@ logger = logging.getLogger(__name__)
 OLLAMA_HOST = os.getenv("OLLAMA_BASE_URL", "https://ollama.curza.com.ar")
 MODEL = os.getenv("GEMMA3_MODEL", "gemma3:12b")
 client = Client(host=OLLAMA_HOST)
+# Un COMMIT (y su fsync) cada COMMIT_EVERY notas en vez de uno por nota
+COMMIT_EVERY = 50
+# Pedidos simultáneos a Ollama: cada hilo pasa casi todo el tiempo esperando la respuesta HTTP
+MAX_WORKERS = int(os.getenv("OLLAMA_MAX_WORKERS", "8"))
 
 # ▶ Definición de tickers y JSON Schema
 TICKERS = ["AAPLD","DESPD","KOD","MELID","MSFTD","NVDAD","TEND","VISTD","XOMD"]
@@ -51,20 +56,21 @@ EXAMPLE = {
     **{tk: 0 for tk in TICKERS}
 }
 
+# Parte fija del prompt: el esquema y el ejemplo se serializan una sola vez al importar
+SCHEMA_STR = orjson.dumps(SCHEMA, option=orjson.OPT_INDENT_2).decode()
+EXAMPLE_STR = orjson.dumps(EXAMPLE, option=orjson.OPT_INDENT_2).decode()
+PROMPT_PREFIX = (
+    "You are an assistant. Validate and output STRICT valid JSON **only**.\n"
+    "Here is the JSON Schema for your response:\n"
+    f"```json\n{SCHEMA_STR}\n```\n"
+    "Example of valid JSON:\n"
+    f"```json\n{EXAMPLE_STR}\n```\n"
+    "Now, given the following post, output a JSON conforming exactly to the schema:\n\n"
+)
+
 def build_strict_prompt(text: str) -> str:
     """Construye prompt con esquema y ejemplo para garantizar JSON válido."""
-    schema_str = json.dumps(SCHEMA, indent=2)
-    example_str = json.dumps(EXAMPLE, indent=2)
-    return (
-        "You are an assistant. Validate and output STRICT valid JSON **only**.\n"
-        "Here is the JSON Schema for your response:\n"
-        f"```json\n{schema_str}\n```\n"
-        "Example of valid JSON:\n"
-        f"```json\n{example_str}\n```\n"
-        "Now, given the following post, output a JSON conforming exactly to the schema:\n\n"
-        f"{text}\n"
-        "Respond using JSON."
-    )
+    return f"{PROMPT_PREFIX}{text}\nRespond using JSON."
 
 def validate_json(data: dict) -> bool:
     """Valida la respuesta con jsonschema."""
@@ -87,8 +93,8 @@ def send_with_retry(prompt: str, retries: int = 2) -> dict:
         )
         content = resp.message.content
         try:
-            data = json.loads(content)
-        except json.JSONDecodeError as e:
+            data = orjson.loads(content)
+        except orjson.JSONDecodeError as e:
             logger.warning(f"Decode error: {e.msg}")
             data = None
 
@@ -98,36 +104,65 @@ def send_with_retry(prompt: str, retries: int = 2) -> dict:
         logger.info(f"Retrying prompt ({attempt+1}/{retries})")
     raise ValueError("Failed to produce valid JSON after retries")
 
+def save_rows(db, rows: list):
+    """Guarda las filas en una sola transacción; si falla, una por una para no perder las válidas."""
+    try:
+        db.add_all(rows)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Commit del lote falló ({e}), se guarda nota por nota")
+        for row in rows:
+            try:
+                db.add(row)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.error(f"❌ note {row.id_nota} failed: {e}")
+
 def process_batch(batch_size: int = 10):
     """Procesa lotes de notas pendientes y almacena resultados."""
     with SessionLocal() as db:  # tipo: Session
-        subq = db.query(NotasXUsuarioGemma.id_nota)
+        # Anti-join: notas sin resultado (usa el índice sobre NotasXUsuarioGemma.id_nota)
         pendientes = (
             db.query(NotasXUsuario)
-              .filter(~NotasXUsuario.id_nota.in_(subq))
+              .outerjoin(NotasXUsuarioGemma, NotasXUsuario.id_nota == NotasXUsuarioGemma.id_nota)
+              .filter(NotasXUsuarioGemma.id_nota.is_(None))
               .order_by(NotasXUsuario.fecha_publicacion)
               .limit(batch_size)
               .all()
         )
 
-        for nota in pendientes:
-            try:
-                prompt = build_strict_prompt(nota.contenido)
-                data = send_with_retry(prompt, retries=2)
-
-                row = NotasXUsuarioGemma(
-                    id_nota=nota.id_nota,
-                    valoracion_llm=data["valoracion_llm"],
-                    relevante_economia=bool(data["relevante_economia"]),
-                    **{tk: bool(data[tk]) for tk in TICKERS}
-                )
-                db.add(row)
-                db.commit()
-                logger.info(f"✔️ note {nota.id_nota} -> {data}")
-
-            except Exception as e:
-                db.rollback()
-                logger.error(f"❌ note {nota.id_nota} failed: {e}")
+        rows_buffer = []
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = {
+                executor.submit(send_with_retry, build_strict_prompt(nota.contenido), 2): nota
+                for nota in pendientes
+            }
+            # La sesión se usa solo desde este hilo, a medida que llegan las respuestas
+            for future in as_completed(futures):
+                nota = futures[future]
+                try:
+                    data = future.result()
+
+                    row = NotasXUsuarioGemma(
+                        id_nota=nota.id_nota,
+                        valoracion_llm=data["valoracion_llm"],
+                        relevante_economia=bool(data["relevante_economia"]),
+                        tickers_mask=sum(TICKER_BITS[tk] for tk in TICKERS if data[tk])
+                    )
+                    rows_buffer.append(row)
+                    logger.info(f"✔️ note {nota.id_nota} -> {data}")
+
+                except Exception as e:
+                    logger.error(f"❌ note {nota.id_nota} failed: {e}")
+
+                if len(rows_buffer) >= COMMIT_EVERY:
+                    save_rows(db, rows_buffer)
+                    rows_buffer.clear()
+
+        if rows_buffer:
+            save_rows(db, rows_buffer)
 
 def main():
     parser = argparse.ArgumentParser(description="Process notes via Ollama with JSON Schema")
@@ -4,13 +4,13 @@
 
 import os
 import logging
-import json
-import re
+import orjson
 import argparse
-from transformers import AutoTokenizer, Gemma3ForCausalLM
+import importlib.util
+from transformers import AutoTokenizer, BitsAndBytesConfig, Gemma3ForCausalLM
 import torch
 from sqlalchemy.orm import Session
-from models import SessionLocal, NotasXUsuario, NotasXUsuarioGemma
+from models import SessionLocal, NotasXUsuario, NotasXUsuarioGemma, TICKER_BITS
 
 # ▶ Logging
 logging.basicConfig(
@@ -26,18 +26,62 @@ logger.info(f"Using device: {DEVICE}")
 
 # ▶ Modelo (usar versión 4B por defecto)
 MODEL_ID = os.getenv("GEMMA3_MODEL", "google/gemma-3-12b-it")
+# Notas por llamada a generate(): el prefill se amortiza en el lote sin agotar la VRAM
+GENERATE_BATCH_SIZE = int(os.getenv("GEMMA3_GENERATE_BATCH", "16"))
+# Un COMMIT (y su fsync) cada COMMIT_EVERY notas en vez de uno por nota
+COMMIT_EVERY = 50
+# GEMMA3_4BIT=1 carga los pesos en 4 bits (NF4, requiere bitsandbytes): decodifica más rápido
+# y ocupa ~1/4 de VRAM, pero es una cuantización con pérdida que puede cambiar las
+# valoraciones. Apagada por defecto para conservar los resultados de bf16
+QUANTIZE_4BIT = os.getenv("GEMMA3_4BIT", "0") == "1"
+# torch.compile del forward (opcional: la primera compilación tarda minutos)
+COMPILE_MODEL = os.getenv("GEMMA3_COMPILE", "0") == "1"
+
+# Tokenizer y modelo ya cargados, por MODEL_ID: cada process_batch reutiliza los mismos pesos
+MODEL_CACHE = {}
 
 
 def load_model():
+    if MODEL_ID in MODEL_CACHE:
+        return MODEL_CACHE[MODEL_ID]
+
     tok = AutoTokenizer.from_pretrained(MODEL_ID)
-    # Usar float16 en GPU para eficiencia, float32 en CPU
-    dtype = torch.float16 if DEVICE.type == "cuda" else torch.float32
-    mdl = (
-        Gemma3ForCausalLM.from_pretrained(MODEL_ID, torch_dtype=dtype)
-        .to(DEVICE)
-        .eval()
-    )
-    return tok, mdl
+    # Padding a la izquierda: en generación por lotes todas las filas deben terminar alineadas
+    tok.padding_side = "left"
+    if tok.pad_token is None:
+        tok.pad_token = tok.eos_token
+    # En GPU: bfloat16 (rango de float32, sin los NaN de float16 en prompts largos) y
+    # FlashAttention-2 si está instalado; en CPU float32 como antes
+    kwargs = {"torch_dtype": torch.float32}
+    if DEVICE.type == "cuda":
+        kwargs["torch_dtype"] = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+        if importlib.util.find_spec("flash_attn") is not None:
+            kwargs["attn_implementation"] = "flash_attention_2"
+        else:
+            logger.info("flash-attn no está instalado, se usa la atención SDPA de PyTorch")
+            kwargs["attn_implementation"] = "sdpa"
+        if QUANTIZE_4BIT and importlib.util.find_spec("bitsandbytes") is not None:
+            # Los pesos ocupan ~4 veces menos; las activaciones siguen en el dtype de arriba
+            kwargs["quantization_config"] = BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_quant_type="nf4",
+                bnb_4bit_compute_dtype=kwargs["torch_dtype"],
+                bnb_4bit_use_double_quant=True,
+            )
+            kwargs["device_map"] = "auto"
+        elif QUANTIZE_4BIT:
+            logger.info("bitsandbytes no está instalado, se carga el modelo sin cuantizar")
+    mdl = Gemma3ForCausalLM.from_pretrained(MODEL_ID, **kwargs)
+    # Un modelo cuantizado ya queda ubicado por device_map y no admite .to()
+    if "quantization_config" not in kwargs:
+        mdl = mdl.to(DEVICE)
+    mdl.eval()
+    if COMPILE_MODEL and DEVICE.type == "cuda":
+        # Se compila solo forward: generate() sigue siendo Python y llama al grafo compilado
+        mdl.forward = torch.compile(mdl.forward, mode="reduce-overhead")
+
+    MODEL_CACHE[MODEL_ID] = (tok, mdl)
+    return MODEL_CACHE[MODEL_ID]
 
 # ▶ Prompt
 TICKERS = ["AAPLD", "DESPD", "KOD", "MELID", "MSFTD", "NVDAD", "TEND", "VISTD", "XOMD"]
@@ -56,95 +100,123 @@ def build_prompt(text: str) -> str:
     )
 
 # ▶ Utilidades
-json_braces = re.compile(r"{.*}", re.S)  # greedy – primera { … última }
-
 def extract_clean_json(text: str) -> dict:
     """
-    - Elimina fences ```json … ``` si los hubiese.
-    - Extrae la primera a última llave { … } para robustez.
+    - Extrae de la primera a la última llave { … }: los fences ```json … ``` quedan afuera.
     - Convierte arrays de tickers en booleans.
     """
-    # quitar ```json ... ``` o ``` ... ```
-    text = re.sub(r"```.*?```", lambda m: m.group(0).strip("```json\n\r "), text, flags=re.S)
-    m = json_braces.search(text)
-    if not m:
+    start = text.find("{")
+    end = text.rfind("}")
+    if start < 0 or end < start:
         raise ValueError("No JSON object found")
-    obj = json.loads(m.group(0))
+    obj = orjson.loads(text[start:end + 1])
 
-    # Si viene lista de tickers, mapear
-    if isinstance(obj.get("ticker"), list):
-        for tk in TICKERS:
-            obj[tk] = 1 if tk in obj["ticker"] else 0
-    if isinstance(obj.get("ticker_relevancia"), list):
-        for tk in TICKERS:
-            obj[tk] = 1 if tk in obj["ticker_relevancia"] else 0
+    # Si viene lista de tickers, mapear (frozenset: pertenencia O(1) en vez de recorrer la lista)
+    for key in ("ticker", "ticker_relevancia"):
+        if isinstance(obj.get(key), list):
+            mencionados = frozenset(tk for tk in obj[key] if isinstance(tk, str))
+            obj.update({tk: int(tk in mencionados) for tk in TICKERS})
 
     # normalizar strings "0"/"1"
     obj["relevante_economia"] = int(obj.get("relevante_economia", 0))
-    for tk in TICKERS:
-        obj[tk] = int(obj.get(tk, 0))
+    obj.update({tk: int(obj.get(tk, 0)) for tk in TICKERS})
     return obj
 
 # ▶ Procesamiento por lotes
+def generate_batch(tokenizer, model, textos: list) -> list:
+    """Genera las respuestas de varias notas con una sola llamada a generate()."""
+    prompts = [
+        tokenizer.apply_chat_template(
+            [
+                {"role": "system", "content": "You are a helpful assistant."},
+                {"role": "user", "content": build_prompt(texto)},
+            ],
+            add_generation_prompt=True,
+            tokenize=False,
+        )
+        for texto in textos
+    ]
+    # El template ya incluye <bos>: no agregar tokens especiales otra vez
+    inputs = tokenizer(
+        prompts, return_tensors="pt", padding=True, add_special_tokens=False
+    ).to(DEVICE)
+
+    with torch.inference_mode():
+        gen = model.generate(
+            **inputs,
+            max_new_tokens=200,
+            do_sample=False,  # greedy
+            pad_token_id=tokenizer.pad_token_id,
+        )
+
+    # Con padding a la izquierda, la respuesta empieza en la misma posición para todas las filas
+    seq_len = inputs["input_ids"].shape[1]
+    return [
+        tokenizer.decode(gen[i, seq_len:], skip_special_tokens=True).strip()
+        for i in range(len(textos))
+    ]
+
+def save_rows(db, rows: list):
+    """Guarda las filas en una sola transacción; si falla, una por una para no perder las válidas."""
+    try:
+        db.add_all(rows)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Commit del lote falló ({e}), se guarda nota por nota")
+        for row in rows:
+            try:
+                db.add(row)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.error(f"❌ note {row.id_nota} failed: {e}")
+
 def process_batch(batch_size: int = 10):
     tokenizer, model = load_model()
 
     with SessionLocal() as db:
-        subq = db.query(NotasXUsuarioGemma.id_nota)
+        # Anti-join: notas sin resultado (usa el índice sobre NotasXUsuarioGemma.id_nota)
         notas = (
             db.query(NotasXUsuario)
-            .filter(~NotasXUsuario.id_nota.in_(subq))
+            .outerjoin(NotasXUsuarioGemma, NotasXUsuario.id_nota == NotasXUsuarioGemma.id_nota)
+            .filter(NotasXUsuarioGemma.id_nota.is_(None))
             .order_by(NotasXUsuario.fecha_publicacion)
             .limit(batch_size)
             .all()
         )
 
-        for nota in notas:
+        rows_buffer = []
+        for start in range(0, len(notas), GENERATE_BATCH_SIZE):
+            lote = notas[start:start + GENERATE_BATCH_SIZE]
             try:
-                prompt = build_prompt(nota.contenido)
-
-                messages = [
-                    {"role": "system", "content": "You are a helpful assistant."},
-                    {"role": "user", "content": prompt},
-                ]
-
-                inputs = tokenizer.apply_chat_template(
-                    messages,
-                    add_generation_prompt=True,
-                    tokenize=True,
-                    return_dict=True,
-                    return_tensors="pt",
-                )
-                # Mover tensores al dispositivo adecuado
-                inputs = {k: v.to(DEVICE) for k, v in inputs.items()}
-
-                with torch.inference_mode():
-                    gen = model.generate(
-                        input_ids=inputs["input_ids"],
-                        attention_mask=inputs.get("attention_mask"),
-                        max_new_tokens=200,
-                        do_sample=False,  # greedy
+                raw_outs = generate_batch(tokenizer, model, [nota.contenido for nota in lote])
+            except Exception as e:
+                logger.error(f"❌ batch {[nota.id_nota for nota in lote]} failed: {e}")
+                continue
+
+            for nota, raw_out in zip(lote, raw_outs):
+                try:
+                    data = extract_clean_json(raw_out)
+
+                    row = NotasXUsuarioGemma(
+                        id_nota=nota.id_nota,
+                        valoracion_llm=data.get("valoracion_llm"),
+                        relevante_economia=bool(data["relevante_economia"]),
+                        tickers_mask=sum(TICKER_BITS[tk] for tk in TICKERS if data[tk]),
                     )
+                    rows_buffer.append(row)
+                    logger.info(f"✔️ note {nota.id_nota} processed -> {data}")
 
-                seq_len = inputs["input_ids"].shape[1]
-                gen_ids = gen[0, seq_len:]
-                raw_out = tokenizer.decode(gen_ids, skip_special_tokens=True).strip()
+                except Exception as e:
+                    logger.error(f"❌ note {nota.id_nota} failed: {e}")
 
-                data = extract_clean_json(raw_out)
+            if len(rows_buffer) >= COMMIT_EVERY:
+                save_rows(db, rows_buffer)
+                rows_buffer.clear()
 
-                row = NotasXUsuarioGemma(
-                    id_nota=nota.id_nota,
-                    valoracion_llm=data.get("valoracion_llm"),
-                    relevante_economia=bool(data["relevante_economia"]),
-                    **{tk: bool(data[tk]) for tk in TICKERS},
-                )
-                db.add(row)
-                db.commit()
-                logger.info(f"✔️ note {nota.id_nota} processed -> {data}")
-
-            except Exception as e:
-                db.rollback()
-                logger.error(f"❌ note {nota.id_nota} failed: {e}")
+        if rows_buffer:
+            save_rows(db, rows_buffer)
 
 # ▶ CLI
 def main():
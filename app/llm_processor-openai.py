@@ -3,10 +3,11 @@
 # Procesa lotes de notas usando OpenAI (gpt-4.1-nano) con JSON Schema y reintentos
 
 import os
-import json
+import orjson
+import asyncio
 import logging
 import argparse
-from openai import OpenAI
+from openai import AsyncOpenAI
 from jsonschema import validate, ValidationError
 from sqlalchemy.orm import Session
 from models import SessionLocal, NotasXUsuario, NotasXUsuarioOpenAI
@@ -22,7 +23,9 @@ logger = logging.getLogger(__name__)
 # ▶ Configuración OpenAI
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 MODEL = os.getenv("OPENAI_MODEL", "gpt-4.1-nano")
-client = OpenAI(api_key=OPENAI_API_KEY)
+client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+# Pedidos simultáneos a la API: las llamadas son solo espera de red, el límite respeta el rate limit
+MAX_CONCURRENT_REQUESTS = int(os.getenv("OPENAI_MAX_CONCURRENCY", "10"))
 
 # ▶ Definición de tickers y JSON Schema
 TICKERS = ["AAPLD","DESPD","KOD","MELID","MSFTD","NVDAD","TEND","VISTD","XOMD"]
@@ -50,20 +53,21 @@ EXAMPLE = {
     **{tk: 0 for tk in TICKERS}
 }
 
+# Parte fija del prompt: el esquema y el ejemplo se serializan una sola vez al importar
+SCHEMA_STR = orjson.dumps(SCHEMA, option=orjson.OPT_INDENT_2).decode()
+EXAMPLE_STR = orjson.dumps(EXAMPLE, option=orjson.OPT_INDENT_2).decode()
+PROMPT_PREFIX = (
+    "You are an assistant. Validate and output STRICT valid JSON **only**.\n"
+    "Here is the JSON Schema for your response:\n"
+    f"```json\n{SCHEMA_STR}\n```\n"
+    "Example of valid JSON:\n"
+    f"```json\n{EXAMPLE_STR}\n```\n"
+    "Now, given the following post, output a JSON conforming exactly to the schema:\n\n"
+)
+
 def build_strict_prompt(text: str) -> str:
     """Construye prompt con esquema y ejemplo para garantizar JSON válido."""
-    schema_str = json.dumps(SCHEMA, indent=2)
-    example_str = json.dumps(EXAMPLE, indent=2)
-    return (
-        "You are an assistant. Validate and output STRICT valid JSON **only**.\n"
-        "Here is the JSON Schema for your response:\n"
-        f"```json\n{schema_str}\n```\n"
-        "Example of valid JSON:\n"
-        f"```json\n{example_str}\n```\n"
-        "Now, given the following post, output a JSON conforming exactly to the schema:\n\n"
-        f"{text}\n"
-        "Respond using JSON."
-    )
+    return f"{PROMPT_PREFIX}{text}\nRespond using JSON."
 
 def validate_json(data: dict) -> bool:
     """Valida la respuesta con jsonschema."""
@@ -74,13 +78,13 @@ def validate_json(data: dict) -> bool:
         logger.warning(f"JSON validation error: {e.message}")
         return False
 
-def send_with_retry(prompt: str, retries: int = 2) -> dict:
+async def send_with_retry(prompt: str, retries: int = 2) -> dict:
     """
     Envía el prompt a OpenAI, valida contra el esquema y reintenta si falla.
     """
     for attempt in range(retries + 1):
         try:
-            response = client.responses.create(
+            response = await client.responses.create(
                 model=MODEL,
                 input=prompt
             )
@@ -96,8 +100,8 @@ def send_with_retry(prompt: str, retries: int = 2) -> dict:
                 elif "```" in content:
                     content = content.split("```")[1].split("```")[0].strip()
                 
-                data = json.loads(content)
-            except json.JSONDecodeError as e:
+                data = orjson.loads(content)
+            except orjson.JSONDecodeError as e:
                 logger.warning(f"Decode error: {e.msg}")
                 data = None
 
@@ -112,37 +116,66 @@ def send_with_retry(prompt: str, retries: int = 2) -> dict:
             
     raise ValueError("Failed to produce valid JSON after retries")
 
+async def classify_notes(pendientes: list) -> list:
+    """Envía todas las notas en paralelo (hasta MAX_CONCURRENT_REQUESTS a la vez)."""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+    async def classify(nota):
+        async with semaphore:
+            return await send_with_retry(build_strict_prompt(nota.contenido), retries=2)
+
+    # return_exceptions: una nota fallida no cancela las demás
+    return await asyncio.gather(*(classify(nota) for nota in pendientes), return_exceptions=True)
+
+def save_rows(db, rows: list):
+    """Guarda las filas en una sola transacción; si falla, una por una para no perder las válidas."""
+    try:
+        db.add_all(rows)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Commit del lote falló ({e}), se guarda nota por nota")
+        for row in rows:
+            try:
+                db.add(row)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.error(f"❌ note {row.id_nota} failed: {e}")
+
 def process_batch(batch_size: int = 10):
     """Procesa lotes de notas pendientes y almacena resultados."""
     with SessionLocal() as db:  # tipo: Session
-        subq = db.query(NotasXUsuarioOpenAI.id_nota)
+        # Anti-join: notas sin resultado (usa el índice sobre NotasXUsuarioOpenAI.id_nota)
         pendientes = (
             db.query(NotasXUsuario)
-              .filter(~NotasXUsuario.id_nota.in_(subq))
+              .outerjoin(NotasXUsuarioOpenAI, NotasXUsuario.id_nota == NotasXUsuarioOpenAI.id_nota)
+              .filter(NotasXUsuarioOpenAI.id_nota.is_(None))
               .order_by(NotasXUsuario.fecha_publicacion)
               .limit(batch_size)
               .all()
         )
 
-        for nota in pendientes:
-            try:
-                prompt = build_strict_prompt(nota.contenido)
-                data = send_with_retry(prompt, retries=2)
+        resultados = asyncio.run(classify_notes(pendientes))
 
-                row = NotasXUsuarioOpenAI(
+        rows = []
+        for nota, data in zip(pendientes, resultados):
+            if isinstance(data, Exception):
+                logger.error(f"❌ note {nota.id_nota} failed: {data}")
+                continue
+            try:
+                rows.append(NotasXUsuarioOpenAI(
                     id_nota=nota.id_nota,
                     valoracion_llm=data["valoracion_llm"],
                     relevante_economia=bool(data["relevante_economia"]),
                     **{tk: bool(data[tk]) for tk in TICKERS}
-                )
-                db.add(row)
-                db.commit()
+                ))
                 logger.info(f"✔️ note {nota.id_nota} -> {data}")
-
             except Exception as e:
-                db.rollback()
                 logger.error(f"❌ note {nota.id_nota} failed: {e}")
 
+        save_rows(db, rows)
+
 def main():
     parser = argparse.ArgumentParser(description="Process notes via OpenAI with JSON Schema")
     parser.add_argument("-n", "--batch-size", type=int, default=10)
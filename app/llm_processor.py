@@ -4,13 +4,12 @@
 
 import os
 import logging
-import json
-import re
+import orjson
 import argparse
 from transformers import AutoTokenizer, Gemma3ForCausalLM
 import torch
 from sqlalchemy.orm import Session
-from models import SessionLocal, NotasXUsuario, NotasXUsuarioGemma
+from models import SessionLocal, NotasXUsuario, NotasXUsuarioGemma, TICKER_BITS
 
 # ▶ Logging
 logging.basicConfig(
@@ -22,6 +21,8 @@ logger = logging.getLogger(__name__)
 
 # ▶ Modelo
 MODEL_ID = os.getenv("GEMMA3_MODEL", "google/gemma-3-1b-it")
+# Un COMMIT (y su fsync) cada COMMIT_EVERY notas en vez de uno por nota
+COMMIT_EVERY = 50
 
 
 def load_model():
@@ -48,51 +49,62 @@ def build_prompt(text: str) -> str:
 
 
 # ▶ Utilidades
-json_braces = re.compile(r"{.*}", re.S)  # greedy – primera { … última }
-
-
 def extract_clean_json(text: str) -> dict:
     """
-    - Elimina fences ```json … ``` si los hubiese.
-    - Extrae la primera a última llave { … } para robustez.
+    - Extrae de la primera a la última llave { … }: los fences ```json … ``` quedan afuera.
     - Convierte arrays de tickers en booleans.
     """
-    # quitar ```json ... ``` o ``` ... ```
-    text = re.sub(r"```.*?```", lambda m: m.group(0).strip("```json\n\r "), text, flags=re.S)
-    m = json_braces.search(text)
-    if not m:
+    start = text.find("{")
+    end = text.rfind("}")
+    if start < 0 or end < start:
         raise ValueError("No JSON object found")
-    obj = json.loads(m.group(0))
+    obj = orjson.loads(text[start:end + 1])
 
-    # Si viene lista de tickers, mapear
-    if isinstance(obj.get("ticker"), list):
-        for tk in TICKERS:
-            obj[tk] = 1 if tk in obj["ticker"] else 0
-    if isinstance(obj.get("ticker_relevancia"), list):
-        for tk in TICKERS:
-            obj[tk] = 1 if tk in obj["ticker_relevancia"] else 0
+    # Si viene lista de tickers, mapear (frozenset: pertenencia O(1) en vez de recorrer la lista)
+    for key in ("ticker", "ticker_relevancia"):
+        if isinstance(obj.get(key), list):
+            mencionados = frozenset(tk for tk in obj[key] if isinstance(tk, str))
+            obj.update({tk: int(tk in mencionados) for tk in TICKERS})
 
     # normalizar strings "0"/"1"
     obj["relevante_economia"] = int(obj.get("relevante_economia", 0))
-    for tk in TICKERS:
-        obj[tk] = int(obj.get(tk, 0))
+    obj.update({tk: int(obj.get(tk, 0)) for tk in TICKERS})
     return obj
 
 
 # ▶ Procesamiento por lotes
+def save_rows(db, rows: list):
+    """Guarda las filas en una sola transacción; si falla, una por una para no perder las válidas."""
+    try:
+        db.add_all(rows)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Commit del lote falló ({e}), se guarda nota por nota")
+        for row in rows:
+            try:
+                db.add(row)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.error(f"❌ note {row.id_nota} failed: {e}")
+
+
 def process_batch(batch_size: int = 10):
     tokenizer, model = load_model()
 
     with SessionLocal() as db:
-        subq = db.query(NotasXUsuarioGemma.id_nota)
+        # Anti-join: notas sin resultado (usa el índice sobre NotasXUsuarioGemma.id_nota)
         notas = (
             db.query(NotasXUsuario)
-            .filter(~NotasXUsuario.id_nota.in_(subq))
+            .outerjoin(NotasXUsuarioGemma, NotasXUsuario.id_nota == NotasXUsuarioGemma.id_nota)
+            .filter(NotasXUsuarioGemma.id_nota.is_(None))
             .order_by(NotasXUsuario.fecha_publicacion)
             .limit(batch_size)
             .all()
         )
 
+        rows_buffer = []
         for nota in notas:
             try:
                 prompt = build_prompt(nota.contenido)
@@ -129,16 +141,21 @@ def process_batch(batch_size: int = 10):
                     id_nota=nota.id_nota,
                     valoracion_llm=data.get("valoracion_llm"),
                     relevante_economia=bool(data["relevante_economia"]),
-                    **{tk: bool(data[tk]) for tk in TICKERS},
+                    tickers_mask=sum(TICKER_BITS[tk] for tk in TICKERS if data[tk]),
                 )
-                db.add(row)
-                db.commit()
+                rows_buffer.append(row)
                 logger.info(f"✔️ note {nota.id_nota} processed -> {data}")
 
             except Exception as e:
-                db.rollback()
                 logger.error(f"❌ note {nota.id_nota} failed: {e}")
 
+            if len(rows_buffer) >= COMMIT_EVERY:
+                save_rows(db, rows_buffer)
+                rows_buffer.clear()
+
+        if rows_buffer:
+            save_rows(db, rows_buffer)
+
 
 # ▶ CLI
 def main():
@@ -1,20 +1,42 @@
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Table, Float, Boolean
-from sqlalchemy.orm import sessionmaker, relationship, declarative_base
+import logging
+from itertools import chain
+import numpy as np
+from sqlalchemy import create_engine, inspect, select, text, Column, MetaData, Computed, Identity, BigInteger, Integer, String, Text, DateTime, ForeignKey, Table, Float, Boolean, Index, func
+from sqlalchemy.dialects.postgresql import ENUM, TSVECTOR, insert
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import sessionmaker, relationship, declarative_base, deferred
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 # Configuración de la base de datos PostgreSQL mediante variables de entorno
 USER = os.getenv("DB_USER", "usuario")
 PASSWORD = os.getenv("DB_PASSWORD", "contraseña")
 HOST = os.getenv("DB_HOST", "db")
 DB = os.getenv("DB_NAME", "patagonia_db")
 
-DATABASE_URL = f"postgresql://{USER}:{PASSWORD}@{HOST}/{DB}"
-engine = create_engine(DATABASE_URL)
+# Driver psycopg (3): COPY por filas (binario o texto) sin armar un CSV a mano
+DATABASE_URL = f"postgresql+psycopg://{USER}:{PASSWORD}@{HOST}/{DB}"
+# - Los INSERT con muchas filas se envían como VALUES multi-fila de hasta 10000 registros
+# - Pool amplio para los importadores que cargan lotes en paralelo; pre_ping descarta
+#   conexiones cortadas por el servidor entre ejecuciones periódicas
+# Los commits son durables por defecto; solo las cargas que se pueden rehacer (bulk_copy y
+# la integración periódica) apagan synchronous_commit en su propia transacción
+engine = create_engine(
+    DATABASE_URL,
+    pool_size=20,
+    max_overflow=40,
+    pool_pre_ping=True,
+    insertmanyvalues_page_size=10000,
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+# Etiquetas de sentimiento que escriben los extractores de Bluesky y el integrador
+Sentimiento = ENUM('Positivo', 'Negativo', 'Neutral', name='sentimiento_t')
+
 class TipoUsuario(Base):
     __tablename__ = 'tipo_usuarios'
     cod_tipo_usuario = Column(String, primary_key=True)
@@ -37,63 +59,135 @@ class Usuario(Base):
     handle = Column(String, nullable=False)
     cod_tipo_usuario = Column(String, ForeignKey('tipo_usuarios.cod_tipo_usuario'))  # Asegurado como String
     verificado = Column(Boolean, default=False)
-    seguidores = Column(Integer)
+    seguidores = Column(Integer)  # no entra en SmallInteger (máx. 32767): las cuentas grandes tienen millones
     cod_pais = Column(String, ForeignKey('paises.cod_pais'), nullable=True)  # Permitir valores nulos explícitamente
     idioma_principal = Column(String)
     score_credibilidad = Column(Float, nullable=True)  # Permitir valores nulos
 
     # Relationships
-    tipo_usuario = relationship("TipoUsuario")
-    pais = relationship("Paises")
-    notas = relationship("NotasXUsuario", back_populates="usuario")
+    # Los catálogos chicos se traen en el mismo SELECT (JOIN); el resto de las relaciones
+    # usa lazy="raise_on_sql": un acceso sin selectinload/joinedload explícito falla en
+    # vez de disparar un SELECT por fila (N+1)
+    tipo_usuario = relationship("TipoUsuario", lazy="joined")
+    pais = relationship("Paises", lazy="joined")
+    # Las notas (y sus hijas) las borra el ON DELETE CASCADE de la base
+    notas = relationship(
+        "NotasXUsuario",
+        back_populates="usuario",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        lazy="raise_on_sql"
+    )
+
+# Los tableros filtran por usuarios verificados: índice parcial solo sobre esa rama
+ix_usuarios_verificados_seguidores = Index(
+    'ix_usuarios_verificados_seguidores', Usuario.seguidores, postgresql_where=text("verificado = true")
+)
 
 class NotasXUsuario(Base):
     __tablename__ = 'notas_x_usuario'
     id_nota = Column(Integer, primary_key=True)
     contenido = Column(Text, nullable=False)
     fecha_publicacion = Column(DateTime, nullable=False)
-    id_usuario = Column(String, ForeignKey('usuarios.id_usuario'), nullable=False)
+    id_usuario = Column(String, ForeignKey('usuarios.id_usuario', ondelete='CASCADE'), nullable=False)
     cod_tipo_nota = Column(Integer, ForeignKey('tipo_notas.cod_tipo_nota'), nullable=False)
     url_nota = Column(String)
     engagement_total = Column(Integer)  # likes + reposts + replies + (shares si existieran)
     score_analisis_sentimiento_nlp = Column(Float)
-    sentimiento = Column(String)  # (positivo, negativo, neutral)
+    sentimiento = Column(Sentimiento)
     score_sentimiento = Column(Float)  # valor entre -1 y 1
+    # Búsqueda de texto: la calcula PostgreSQL al insertar; diferida para no traerla con cada nota
+    contenido_tsv = deferred(Column(TSVECTOR, Computed("to_tsvector('simple', contenido)", persisted=True)))
 
     # Relationships
-    usuario = relationship("Usuario", back_populates="notas")
-    tipo_nota = relationship("TipoNota")
-    empresas = relationship("EmpresasXNota", back_populates="nota", cascade="all, delete-orphan")
+    # passive_deletes: al borrar una nota, las filas hijas las elimina el ON DELETE CASCADE
+    # de la base, sin cargar las colecciones (que no admiten carga implícita)
+    usuario = relationship("Usuario", back_populates="notas", lazy="raise_on_sql")
+    tipo_nota = relationship("TipoNota", lazy="joined")
+    empresas = relationship(
+        "EmpresasXNota",
+        back_populates="nota",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        lazy="raise_on_sql"
+    )
     llm_outputs = relationship(
         "NotasXUsuarioGemma",
         back_populates="nota",
-        cascade="all, delete-orphan"
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        lazy="raise_on_sql"
     )
     openai_outputs = relationship(
         "NotasXUsuarioOpenAI",
         back_populates="nota",
-        cascade="all, delete-orphan"
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        lazy="raise_on_sql"
     )
+
+# Una nota por URI de origen: destino del ON CONFLICT en integrador_periodico.py
+uq_notas_url_nota = Index('uq_notas_x_usuario_url_nota', NotasXUsuario.url_nota, unique=True)
+# Claves foráneas: PostgreSQL no las indexa solo y cada join usuario→notas recorrería la tabla
+ix_notas_id_usuario = Index('ix_notas_x_usuario_id_usuario', NotasXUsuario.id_usuario)
+ix_notas_cod_tipo_nota = Index('ix_notas_x_usuario_cod_tipo_nota', NotasXUsuario.cod_tipo_nota)
+# contenido_tsv @@ plainto_tsquery('simple', ...) en lugar de ILIKE '%...%' sobre toda la tabla
+ix_notas_contenido_tsv = Index('ix_notas_x_usuario_contenido_tsv', NotasXUsuario.contenido_tsv, postgresql_using='gin')
         
 
+# Bit de cada ticker en NotasXUsuarioGemma.tickers_mask
+TICKER_BITS = {
+    ticker: 1 << i
+    for i, ticker in enumerate(["AAPLD", "DESPD", "KOD", "MELID", "MSFTD", "NVDAD", "TEND", "VISTD", "XOMD"])
+}
+
+def ticker_flag(bit):
+    """Atributo booleano guardado en un bit de tickers_mask (también se puede usar en filtros)"""
+    @hybrid_property
+    def flag(self):
+        return bool((self.tickers_mask or 0) & bit)
+
+    @flag.setter
+    def flag(self, value):
+        mask = self.tickers_mask or 0
+        self.tickers_mask = mask | bit if value else mask & ~bit
+
+    @flag.expression
+    def flag(cls):
+        return cls.tickers_mask.op('&')(bit) != 0
+
+    return flag
+
 # New table to store LLM outputs
 class NotasXUsuarioGemma(Base):
     __tablename__ = 'notas_x_usuario_gemma'
-    id = Column(Integer, primary_key=True, autoincrement=True)
+    id = Column(BigInteger, Identity(always=False, cache=10000), primary_key=True)
     id_nota = Column(Integer, ForeignKey('notas_x_usuario.id_nota', ondelete='CASCADE'), nullable=False)
     valoracion_llm = Column(String, nullable=False)  # 'positivo','negativo','neutral'
     relevante_economia = Column(Boolean, nullable=False)  # True=1/False=0
-    AAPLD = Column(Boolean, default=False)
-    DESPD = Column(Boolean, default=False)
-    KOD = Column(Boolean, default=False)
-    MELID = Column(Boolean, default=False)
-    MSFTD = Column(Boolean, default=False)
-    NVDAD = Column(Boolean, default=False)
-    TEND = Column(Boolean, default=False)
-    VISTD = Column(Boolean, default=False)
-    XOMD = Column(Boolean, default=False)
+    # Los nueve tickers mencionados en un solo entero: bit TICKER_BITS[ticker] = 1
+    tickers_mask = Column(Integer, nullable=False, default=0)
+    AAPLD = ticker_flag(TICKER_BITS["AAPLD"])
+    DESPD = ticker_flag(TICKER_BITS["DESPD"])
+    KOD = ticker_flag(TICKER_BITS["KOD"])
+    MELID = ticker_flag(TICKER_BITS["MELID"])
+    MSFTD = ticker_flag(TICKER_BITS["MSFTD"])
+    NVDAD = ticker_flag(TICKER_BITS["NVDAD"])
+    TEND = ticker_flag(TICKER_BITS["TEND"])
+    VISTD = ticker_flag(TICKER_BITS["VISTD"])
+    XOMD = ticker_flag(TICKER_BITS["XOMD"])
 
-    nota = relationship("NotasXUsuario", back_populates="llm_outputs")
+    nota = relationship("NotasXUsuario", back_populates="llm_outputs", lazy="raise_on_sql")
+
+# Búsqueda de notas pendientes (anti-join por id_nota) en los llm_processor
+ix_notas_gemma_id_nota = Index('ix_notas_x_usuario_gemma_id_nota', NotasXUsuarioGemma.id_nota)
+# Notas relevantes para la economía: índice parcial que además cubre las columnas que
+# leen los tableros (id_nota, valoracion_llm, tickers_mask) y permite index-only scans
+ix_notas_gemma_relevantes = Index(
+    'ix_notas_x_usuario_gemma_relevantes',
+    NotasXUsuarioGemma.id_nota, NotasXUsuarioGemma.valoracion_llm, NotasXUsuarioGemma.tickers_mask,
+    postgresql_where=text("relevante_economia = true")
+)
 
 # New table to store OpenAI outputs
 class NotasXUsuarioOpenAI(Base):
@@ -112,7 +206,9 @@ class NotasXUsuarioOpenAI(Base):
     VISTD = Column(Boolean, default=False)
     XOMD = Column(Boolean, default=False)
 
-    nota = relationship("NotasXUsuario", back_populates="openai_outputs")
+    nota = relationship("NotasXUsuario", back_populates="openai_outputs", lazy="raise_on_sql")
+
+ix_notas_openai_id_nota = Index('ix_notas_x_usuario_openai_id_nota', NotasXUsuarioOpenAI.id_nota)
 
 class Empresas(Base):
     __tablename__ = 'empresas'
@@ -123,13 +219,26 @@ class Empresas(Base):
     capitalizacion_bursatil = Column(Float)
 
     # Relationships
-    cotizaciones = relationship("CotizacionXEmpresa", back_populates="empresa")
-    eventos = relationship("EventosFinancierosXEmpresa", back_populates="empresa")
+    # Cotizaciones y eventos los borra el ON DELETE CASCADE de la base
+    cotizaciones = relationship(
+        "CotizacionXEmpresa",
+        back_populates="empresa",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        lazy="raise_on_sql"
+    )
+    eventos = relationship(
+        "EventosFinancierosXEmpresa",
+        back_populates="empresa",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        lazy="raise_on_sql"
+    )
 
 class EmpresasXNota(Base):
     __tablename__ = 'empresas_x_nota'
     id_nota = Column(Integer, ForeignKey('notas_x_usuario.id_nota', ondelete='CASCADE'), primary_key=True)
-    id_empresa = Column(Integer, ForeignKey('empresas.id_empresa'), primary_key=True)
+    id_empresa = Column(Integer, ForeignKey('empresas.id_empresa', ondelete='CASCADE'), primary_key=True)
     fuente_extraccion = Column(String)  # modelo que detectó la mención
     tipo_mencion = Column(String)  # (directa, ticker, similar)
     contexto = Column(Text)  # fragmento donde aparece
@@ -138,8 +247,11 @@ class EmpresasXNota(Base):
     tiempo_reaccion = Column(Float)  # Minutos/hora después de la nota donde se observó el impacto
 
     # Relationships
-    nota = relationship("NotasXUsuario", back_populates="empresas")
-    empresa = relationship("Empresas")
+    nota = relationship("NotasXUsuario", back_populates="empresas", lazy="raise_on_sql")
+    empresa = relationship("Empresas", lazy="raise_on_sql")
+
+# La PK (id_nota, id_empresa) no sirve para buscar las notas de una empresa
+ix_empresas_x_nota_id_empresa = Index('ix_empresas_x_nota_id_empresa', EmpresasXNota.id_empresa)
 
 class TipoEvento(Base):
     __tablename__ = 'tipo_evento'
@@ -150,20 +262,25 @@ class TipoEvento(Base):
 class EventosFinancierosXEmpresa(Base):
     __tablename__ = 'eventos_financieros_x_empresa'
     id_evento = Column(Integer, primary_key=True)
-    id_empresa = Column(Integer, ForeignKey('empresas.id_empresa'))
+    id_empresa = Column(Integer, ForeignKey('empresas.id_empresa', ondelete='CASCADE'))
     id_tipo_evento = Column(Integer, ForeignKey('tipo_evento.id_tipo_evento'))
     fecha_evento = Column(DateTime)
     descripcion = Column(Text)
     impacto_esperado = Column(String)  # valores posibles: positivo,negativo,neutral,incierto,depende
 
     # Relationships
-    empresa = relationship("Empresas", back_populates="eventos")
-    tipo_evento = relationship("TipoEvento")
+    empresa = relationship("Empresas", back_populates="eventos", lazy="raise_on_sql")
+    tipo_evento = relationship("TipoEvento", lazy="raise_on_sql")
+
+# Eventos de una empresa en un rango de fechas: igualdad primero, rango después
+ix_eventos_empresa_fecha = Index(
+    'ix_eventos_financieros_x_empresa_empresa_fecha', EventosFinancierosXEmpresa.id_empresa, EventosFinancierosXEmpresa.fecha_evento
+)
 
 class CotizacionXEmpresa(Base):
     __tablename__ = 'cotizacion_x_empresa'
     id_cotizacion = Column(Integer, primary_key=True)
-    id_empresa = Column(Integer, ForeignKey('empresas.id_empresa'))
+    id_empresa = Column(Integer, ForeignKey('empresas.id_empresa', ondelete='CASCADE'))
     fecha = Column(DateTime, nullable=False)
     precio_apertura = Column(Float)
     precio_cierre = Column(Float)
@@ -173,12 +290,19 @@ class CotizacionXEmpresa(Base):
     variacion_porcentaje = Column(Float)
 
     # Relationships
-    empresa = relationship("Empresas", back_populates="cotizaciones")
+    empresa = relationship("Empresas", back_populates="cotizaciones", lazy="raise_on_sql")
+
+# Una cotización por empresa y fecha: destino del ON CONFLICT en integrador_periodico.py
+uq_cotizacion_empresa_fecha = Index(
+    'uq_cotizacion_x_empresa_empresa_fecha', CotizacionXEmpresa.id_empresa, CotizacionXEmpresa.fecha, unique=True
+)
+# Rangos de fechas sin empresa: la tabla se carga en orden cronológico y BRIN ocupa una fracción de un btree
+ix_cotizacion_fecha_brin = Index('ix_cotizacion_x_empresa_fecha_brin', CotizacionXEmpresa.fecha, postgresql_using='brin')
 
 class TablaPPI(Base):
     __tablename__ = 'tabla_ppi'
     
-    id = Column(Integer, primary_key=True, autoincrement=True)
+    id = Column(BigInteger, Identity(always=False, cache=10000), primary_key=True)
     Date = Column(DateTime, nullable=False)
     Price = Column(Float)
     Volume = Column(Float)
@@ -194,14 +318,22 @@ class TablaPPI(Base):
     def __repr__(self):
         return f"<TablaPPI(Date='{self.Date}', ticker='{self.ticker}', Price={self.Price})>"
 
+# Un registro por ticker y día: destino del ON CONFLICT en extrae-ppi-postgres.py
+uq_tabla_ppi_dia_ticker = Index('uq_tabla_ppi_dia_ticker', func.date(TablaPPI.Date), TablaPPI.ticker, unique=True)
+# Última fecha por ticker (MAX(Date) ... GROUP BY ticker) resuelta con el índice y sin recorrer la tabla
+ix_tabla_ppi_ticker_date = Index('ix_tabla_ppi_ticker_date', TablaPPI.ticker, TablaPPI.Date.desc())
+# Rangos de fechas de todos los tickers (tabla de solo inserción, en orden de fecha)
+ix_tabla_ppi_date_brin = Index('ix_tabla_ppi_date_brin', TablaPPI.Date, postgresql_using='brin')
+
 class TablaPostsBluesky(Base):
     __tablename__ = 'tabla_posts_bluesky'
     
-    id = Column(Integer, primary_key=True, autoincrement=True)
+    id = Column(BigInteger, Identity(always=False, cache=10000), primary_key=True)
     actor_handle = Column(String, nullable=False)
-    uri = Column(String, nullable=False)
+    uri = Column(String, nullable=False)  # Clave de deduplicación (ON CONFLICT, uq_posts_bluesky_uri)
     text = Column(Text)
     created_at = Column(DateTime, nullable=False)
+    # Conteos en Integer y no SmallInteger: un post viral supera los 32767 likes/reposts
     likes = Column(Integer, default=0)
     reposts = Column(Integer, default=0)
     replies = Column(Integer, default=0)
@@ -209,12 +341,328 @@ class TablaPostsBluesky(Base):
     # Nuevos campos para análisis de sentimiento y engagement
     engagement = Column(Integer, default=0)
     textblob_sentiment = Column(Float)
-    textblob_sentiment_label = Column(String)
+    textblob_sentiment_label = Column(Sentimiento)
     vader_sentiment = Column(Float)
-    vader_sentiment_label = Column(String)
+    vader_sentiment_label = Column(Sentimiento)
+    text_tsv = deferred(Column(TSVECTOR, Computed("to_tsvector('simple', coalesce(text, ''))", persisted=True)))
     
     def __repr__(self):
         return f"<TablaPostsBluesky(actor_handle='{self.actor_handle}', created_at='{self.created_at}')>"
 
+# Un post por URI: destino del ON CONFLICT de los extractores e importadores de Bluesky
+uq_posts_bluesky_uri = Index('uq_tabla_posts_bluesky_uri', TablaPostsBluesky.uri, unique=True)
+# MAX(created_at) del último post importado: lectura de la primera hoja del índice
+ix_posts_bluesky_created_at = Index('ix_posts_bluesky_created_at', TablaPostsBluesky.created_at.desc())
+# Posts de un autor por fecha
+ix_posts_bluesky_actor_created_at = Index(
+    'ix_posts_bluesky_actor_created_at', TablaPostsBluesky.actor_handle, TablaPostsBluesky.created_at
+)
+ix_posts_bluesky_text_tsv = Index('ix_posts_bluesky_text_tsv', TablaPostsBluesky.text_tsv, postgresql_using='gin')
+
+def migrate_gemma_tickers_mask():
+    """Pasa las nueve columnas booleanas de notas_x_usuario_gemma (esquema anterior) a tickers_mask"""
+    columns = {column['name'] for column in inspect(engine).get_columns(NotasXUsuarioGemma.__tablename__)}
+    old_columns = [ticker for ticker in TICKER_BITS if ticker in columns]
+    if not old_columns:
+        return
+    table = NotasXUsuarioGemma.__tablename__
+    mask = ' | '.join(f'(CASE WHEN "{ticker}" THEN {TICKER_BITS[ticker]} ELSE 0 END)' for ticker in old_columns)
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS tickers_mask integer NOT NULL DEFAULT 0"))
+        conn.execute(text(f"UPDATE {table} SET tickers_mask = {mask}"))
+        for ticker in old_columns:
+            conn.execute(text(f'ALTER TABLE {table} DROP COLUMN "{ticker}"'))
+
+# Tablas de carga masiva con id BIGINT IDENTITY CACHE 10000 (antes SERIAL int4)
+IDENTITY_TABLES = [NotasXUsuarioGemma.__table__, TablaPPI.__table__, TablaPostsBluesky.__table__]
+
+def migrate_identity_ids():
+    """Pasa el id SERIAL de las tablas ya creadas a bigint y agranda la caché de su secuencia"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in IDENTITY_TABLES:
+            id_column = next(column for column in inspector.get_columns(table.name) if column['name'] == 'id')
+            if isinstance(id_column['type'], BigInteger):
+                continue
+            conn.execute(text(f"ALTER TABLE {table.name} ALTER COLUMN id TYPE bigint"))
+            sequence = conn.execute(text(f"SELECT pg_get_serial_sequence('{table.name}', 'id')")).scalar()
+            if sequence:
+                conn.execute(text(f"ALTER SEQUENCE {sequence} AS bigint CACHE 10000"))
+
+def migrate_cascade_fks():
+    """Recrea con ON DELETE CASCADE las claves foráneas de tablas ya creadas que no lo tienen"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            cascade_columns = {fk.parent.name for fk in table.foreign_keys if fk.ondelete == 'CASCADE'}
+            for fk in inspector.get_foreign_keys(table.name):
+                columns = fk['constrained_columns']
+                if columns[0] not in cascade_columns or fk['options'].get('ondelete') == 'CASCADE':
+                    continue
+                conn.execute(text(f"ALTER TABLE {table.name} DROP CONSTRAINT {fk['name']}"))
+                conn.execute(text(
+                    f"ALTER TABLE {table.name} ADD CONSTRAINT {fk['name']} FOREIGN KEY ({', '.join(columns)}) "
+                    f"REFERENCES {fk['referred_table']} ({', '.join(fk['referred_columns'])}) ON DELETE CASCADE"
+                ))
+
+# Columnas con las etiquetas de sentimiento (antes texto libre)
+SENTIMIENTO_COLUMNS = [
+    (NotasXUsuario.__table__, 'sentimiento'),
+    (TablaPostsBluesky.__table__, 'textblob_sentiment_label'),
+    (TablaPostsBluesky.__table__, 'vader_sentiment_label'),
+]
+
+def migrate_sentimiento_enum():
+    """Convierte las etiquetas de sentimiento de las tablas ya creadas al tipo sentimiento_t"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        Sentimiento.create(bind=conn, checkfirst=True)
+        for table, column in SENTIMIENTO_COLUMNS:
+            current = next(col for col in inspector.get_columns(table.name) if col['name'] == column)
+            if isinstance(current['type'], ENUM):
+                continue
+            # Las cadenas vacías pasan a NULL; cualquier otra etiqueta fuera del vocabulario hace fallar el ALTER
+            conn.execute(text(
+                f"ALTER TABLE {table.name} ALTER COLUMN {column} TYPE {Sentimiento.name} "
+                f"USING nullif({column}, '')::{Sentimiento.name}"
+            ))
+
+# Columnas de texto largo: (tabla, columna, columna tsvector generada)
+TEXT_SEARCH_COLUMNS = [
+    (NotasXUsuario.__table__, 'contenido', 'contenido_tsv'),
+    (TablaPostsBluesky.__table__, 'text', 'text_tsv'),
+]
+
+def migrate_text_search():
+    """
+    Agrega las columnas tsvector a tablas ya existentes y comprime los textos largos con
+    LZ4. Cada ALTER se ejecuta solo si el catálogo muestra que falta: init_db corre en
+    cada extractor y un ALTER TABLE bloquea la tabla aunque no cambie nada.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table, column, tsv_column in TEXT_SEARCH_COLUMNS:
+            if tsv_column not in {existing['name'] for existing in inspector.get_columns(table.name)}:
+                expression = table.c[tsv_column].computed.sqltext
+                conn.execute(text(
+                    f"ALTER TABLE {table.name} ADD COLUMN {tsv_column} tsvector "
+                    f"GENERATED ALWAYS AS ({expression}) STORED"
+                ))
+            # El toast_tuple_target por defecto (~2 KB) deja en la fila la mayoría de los posts:
+            # los procesadores LLM leen contenido nota por nota y cada valor en TOAST es una
+            # lectura más. Se quita el valor mínimo (128) que fijaba una versión anterior
+            reloptions = conn.execute(
+                text("SELECT reloptions FROM pg_class WHERE oid = CAST(:table AS regclass)"), {"table": table.name}
+            ).scalar() or []
+            if any(option.startswith('toast_tuple_target=') for option in reloptions):
+                conn.execute(text(f"ALTER TABLE {table.name} RESET (toast_tuple_target)"))
+            # LZ4 (PostgreSQL 14+) descomprime bastante más rápido que pglz; aplica a los valores nuevos
+            if conn.dialect.server_version_info >= (14,):
+                compression = conn.execute(text(
+                    "SELECT attcompression FROM pg_attribute "
+                    "WHERE attrelid = CAST(:table AS regclass) AND attname = :column"
+                ), {"table": table.name, "column": column}).scalar()
+                if compression != 'l':
+                    conn.execute(text(f'ALTER TABLE {table.name} ALTER COLUMN "{column}" SET COMPRESSION lz4'))
+
+# Nota con autor, valoración de Gemma (la última) y empresas mencionadas: la consulta de
+# los tableros, precalculada y actualizada con refresh_mv() en cada integración periódica
+MV_NOTA_ENRIQUECIDA = """
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_nota_enriquecida AS
+SELECT n.id_nota, n.fecha_publicacion, n.contenido, n.engagement_total,
+       n.score_sentimiento, u.handle, u.verificado, u.cod_pais,
+       g.valoracion_llm, g.relevante_economia, g.tickers_mask,
+       COALESCE(e.empresas, '{}') AS empresas
+FROM notas_x_usuario n
+JOIN usuarios u ON u.id_usuario = n.id_usuario
+LEFT JOIN LATERAL (
+    SELECT valoracion_llm, relevante_economia, tickers_mask
+    FROM notas_x_usuario_gemma
+    WHERE id_nota = n.id_nota
+    ORDER BY id DESC
+    LIMIT 1
+) g ON TRUE
+LEFT JOIN LATERAL (
+    SELECT array_agg(id_empresa ORDER BY id_empresa) AS empresas
+    FROM empresas_x_nota
+    WHERE id_nota = n.id_nota
+) e ON TRUE
+"""
+
+def create_mv():
+    """Crea la vista materializada mv_nota_enriquecida y su índice único (requerido por REFRESH CONCURRENTLY)"""
+    with engine.begin() as conn:
+        conn.execute(text(MV_NOTA_ENRIQUECIDA))
+        conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_mv_nota_enriquecida_id_nota ON mv_nota_enriquecida (id_nota)"))
+
+def refresh_mv():
+    """Recalcula mv_nota_enriquecida sin bloquear las lecturas (se puede llamar desde cron)"""
+    with engine.begin() as conn:
+        conn.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY mv_nota_enriquecida"))
+
+def index_exists(index):
+    """Indica si el índice ya está creado en la base"""
+    return index.name in {existing['name'] for existing in inspect(engine).get_indexes(index.table.name)}
+
+def duplicates_query(index):
+    """
+    SELECT (clave primaria, clave primaria que se conserva) de las filas que violarían el
+    índice único: de cada grupo queda la de mayor clave primaria (la última carga). Las
+    filas con algún NULL en la clave no se comparan, igual que en el índice.
+    """
+    table = index.table
+    pk = table.primary_key.columns.values()[0].name
+    expressions = [str(expression.compile(dialect=engine.dialect)) for expression in index.expressions]
+    key = ', '.join(expressions)
+    not_null = ' AND '.join(f"{expression} IS NOT NULL" for expression in expressions)
+    return (
+        f"SELECT {pk} AS repetida, conservada FROM ("
+        f"SELECT {pk}, max({pk}) OVER (PARTITION BY {key}) AS conservada FROM {table.name} WHERE {not_null}"
+        f") AS grupos WHERE {pk} <> conservada"
+    )
+
+def remove_duplicates_for_index(index):
+    """
+    Antes de crear un índice único en una tabla ya existente, borra las filas que lo
+    violarían (ver duplicates_query). No hace nada si el índice ya existe.
+    """
+    if index_exists(index):
+        return
+    table = index.table
+    pk = table.primary_key.columns.values()[0].name
+    with engine.begin() as conn:
+        deleted = conn.execute(text(
+            f"DELETE FROM {table.name} WHERE {pk} IN (SELECT repetida FROM ({duplicates_query(index)}) AS d)"
+        )).rowcount
+    if deleted:
+        logger.warning(f"Se eliminaron {deleted} filas duplicadas de {table.name} para crear {index.name}")
+
+def merge_duplicate_notas():
+    """
+    Antes de crear uq_notas_url_nota: las notas repetidas por URL pasan sus salidas de
+    LLM y sus empresas a la nota que se conserva y después se borran (ON DELETE CASCADE
+    limpia las empresas que ya estaban en la conservada). No hace nada si el índice ya existe.
+    """
+    if index_exists(uq_notas_url_nota):
+        return
+    empresas_columns = [column.name for column in EmpresasXNota.__table__.columns if column.name != 'id_nota']
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE TEMP TABLE notas_repetidas ON COMMIT DROP AS {duplicates_query(uq_notas_url_nota)}"))
+        for model in (NotasXUsuarioGemma, NotasXUsuarioOpenAI):
+            conn.execute(text(
+                f"UPDATE {model.__tablename__} AS hija SET id_nota = r.conservada "
+                f"FROM notas_repetidas AS r WHERE hija.id_nota = r.repetida"
+            ))
+        conn.execute(text(
+            f"INSERT INTO {EmpresasXNota.__tablename__} (id_nota, {', '.join(empresas_columns)}) "
+            f"SELECT r.conservada, {', '.join('e.' + column for column in empresas_columns)} "
+            f"FROM {EmpresasXNota.__tablename__} AS e JOIN notas_repetidas AS r ON e.id_nota = r.repetida "
+            f"ON CONFLICT DO NOTHING"
+        ))
+        deleted = conn.execute(text(
+            f"DELETE FROM {NotasXUsuario.__tablename__} WHERE id_nota IN (SELECT repetida FROM notas_repetidas)"
+        )).rowcount
+    if deleted:
+        logger.warning(f"Se unificaron {deleted} notas con URL repetida para crear {uq_notas_url_nota.name}")
+
 def init_db():
     Base.metadata.create_all(bind=engine)
+    migrate_gemma_tickers_mask()
+    migrate_identity_ids()
+    migrate_sentimiento_enum()
+    migrate_cascade_fks()
+    migrate_text_search()
+    create_mv()
+    # Índices únicos de deduplicación (destino de ON CONFLICT): en tablas ya cargadas
+    # pueden existir filas repetidas que impedirían crearlos
+    remove_duplicates_for_index(uq_tabla_ppi_dia_ticker)
+    remove_duplicates_for_index(uq_posts_bluesky_uri)
+    remove_duplicates_for_index(uq_cotizacion_empresa_fecha)
+    merge_duplicate_notas()
+    # create_all no agrega índices a tablas que ya existían
+    for index in (ix_tabla_ppi_ticker_date, ix_posts_bluesky_created_at,
+                  ix_notas_gemma_id_nota, ix_notas_openai_id_nota,
+                  uq_cotizacion_empresa_fecha, uq_notas_url_nota,
+                  ix_notas_id_usuario, ix_notas_cod_tipo_nota, ix_empresas_x_nota_id_empresa,
+                  ix_eventos_empresa_fecha, ix_cotizacion_fecha_brin, ix_tabla_ppi_date_brin,
+                  ix_posts_bluesky_actor_created_at, ix_notas_contenido_tsv, ix_posts_bluesky_text_tsv,
+                  ix_usuarios_verificados_seguidores, ix_notas_gemma_relevantes,
+                  uq_tabla_ppi_dia_ticker, uq_posts_bluesky_uri):
+        index.create(bind=engine, checkfirst=True)
+
+# Tipo de PostgreSQL de cada columna para COPY binario (Text hereda de String)
+COPY_TYPES = [(Boolean, 'bool'), (BigInteger, 'int8'), (Integer, 'int4'), (Float, 'float8'), (DateTime, 'timestamp'), (String, 'text')]
+
+def copy_type(column):
+    """Nombre del tipo de PostgreSQL que espera COPY BINARY para la columna"""
+    for sql_type, pg_type in COPY_TYPES:
+        if isinstance(column.type, sql_type):
+            return pg_type
+    raise TypeError(f"Tipo sin mapeo para COPY binario: {column.name} ({column.type})")
+
+def copy_value(value):
+    """
+    None, NaN y NaT de pandas se cargan como NULL; escalares de numpy y pd.Timestamp
+    pasan a los tipos de Python que psycopg sabe volcar en COPY texto y binario
+    """
+    try:
+        if value is None or value != value:
+            return None
+    except TypeError:  # pd.NA no admite comparación
+        return None
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, datetime):
+        if hasattr(value, 'to_pydatetime'):  # pd.Timestamp
+            value = value.to_pydatetime()
+        # Las columnas son timestamp sin zona: PostgreSQL descarta el offset igual que en un INSERT
+        if value.tzinfo is not None:
+            value = value.replace(tzinfo=None)
+    return value
+
+def bulk_copy(db, model, rows, conflict_target=None, binary=False):
+    """
+    Carga filas (diccionarios) en la tabla del modelo con COPY FROM STDIN: un único
+    envío en lugar de un INSERT por lote. Con conflict_target (columnas o expresiones de
+    un índice único, como index_elements) las filas pasan por una tabla temporal y se
+    descartan las que chocan con ese índice (ON CONFLICT (...) DO NOTHING); si el índice
+    no existe, PostgreSQL da error en lugar de insertar duplicados.
+    Con binary usa COPY binario (sin convertir números y fechas a texto); los tipos salen
+    de las columnas del modelo. No hace commit: queda en la transacción de la sesión
+    (con synchronous_commit apagado solo para esa transacción).
+    Devuelve las filas agregadas.
+    """
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return 0
+    
+    table = model.__tablename__
+    columns = [column for column in model.__table__.columns if column.name in first]
+    column_list = ', '.join(f'"{column.name}"' for column in columns)
+    target = f"tmp_{table}" if conflict_target else table
+    
+    cursor = db.connection().connection.cursor()
+    # El COMMIT de la carga no espera el fsync del WAL: ante una caída se pierde a lo sumo
+    # este lote, que el scraper o importador vuelve a cargar al re-ejecutarse
+    cursor.execute("SET LOCAL synchronous_commit = OFF")
+    if conflict_target:
+        # COPY no admite ON CONFLICT: se carga en una tabla temporal sin restricciones
+        # y la deduplicación la hace un único INSERT ... SELECT
+        cursor.execute(f"DROP TABLE IF EXISTS {target}")
+        cursor.execute(f"CREATE TEMP TABLE {target} ON COMMIT DROP AS SELECT {column_list} FROM {table} WITH NO DATA")
+    
+    copy_format = "BINARY" if binary else "TEXT"
+    with cursor.copy(f"COPY {target} ({column_list}) FROM STDIN (FORMAT {copy_format})") as copy:
+        if binary:
+            copy.set_types([copy_type(column) for column in columns])
+        for row in chain([first], rows):
+            copy.write_row([copy_value(row.get(column.name)) for column in columns])
+    
+    if conflict_target:
+        staging = Table(target, MetaData(), *[Column(column.name, column.type) for column in columns])
+        stmt = insert(model.__table__).from_select(
+            [column.name for column in columns], select(*staging.columns)
+        ).on_conflict_do_nothing(index_elements=conflict_target)
+        return db.execute(stmt).rowcount
+    return cursor.rowcount
@@ -0,0 +1,177 @@
+import os
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql
+
+# The app/ scripts import "models" as a top-level module
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+
+from models import TablaPPI, TablaPostsBluesky, bulk_copy, copy_type, copy_value
+
+
+class FakeCopy:
+    """Records what bulk_copy sends to psycopg during COPY"""
+    def __init__(self):
+        self.types = None
+        self.rows = []
+
+    def set_types(self, types):
+        self.types = types
+
+    def write_row(self, row):
+        self.rows.append(row)
+
+
+class FakeCursor:
+    def __init__(self):
+        self.statements = []
+        self.copy_sql = None
+        self.copy_obj = FakeCopy()
+        self.rowcount = 3
+
+    def execute(self, sql):
+        self.statements.append(sql)
+
+    @contextmanager
+    def copy(self, sql):
+        self.copy_sql = sql
+        yield self.copy_obj
+
+
+class FakeResult:
+    rowcount = 2
+
+
+class FakeSession:
+    """Minimal session: the DBAPI connection (cursor) and db.execute for the INSERT ... ON CONFLICT"""
+    def __init__(self):
+        self.cursor = FakeCursor()
+        self.executed = []
+
+    def connection(self):
+        session = self
+
+        class DBAPIConnection:
+            def cursor(self):
+                return session.cursor
+
+        class Connection:
+            connection = DBAPIConnection()
+
+        return Connection()
+
+    def execute(self, stmt):
+        self.executed.append(str(stmt.compile(dialect=postgresql.dialect())))
+        return FakeResult()
+
+
+@pytest.mark.parametrize("value", [None, float('nan'), np.nan, np.float64('nan'), pd.NaT, pd.NA])
+def test_copy_value_nulls(value):
+    assert copy_value(value) is None
+
+
+def test_copy_value_timestamps():
+    aware = copy_value(pd.Timestamp('2025-01-02 10:30', tz='UTC'))
+    assert aware == datetime(2025, 1, 2, 10, 30)
+    assert type(aware) is datetime and aware.tzinfo is None
+
+    naive = copy_value(pd.Timestamp('2025-01-02 10:30'))
+    assert naive == datetime(2025, 1, 2, 10, 30)
+    assert type(naive) is datetime
+
+
+def test_copy_value_numpy_scalars():
+    for value, expected, expected_type in [
+        (np.int64(7), 7, int),
+        (np.int32(-3), -3, int),
+        (np.float64(1.5), 1.5, float),
+        (np.float32(0.25), 0.25, float),
+        (np.bool_(True), True, bool),
+    ]:
+        result = copy_value(value)
+        assert result == expected
+        assert type(result) is expected_type
+
+
+def test_copy_value_keeps_text_untouched():
+    # In text COPY, psycopg (write_row) escapes tabs, newlines and backslashes
+    text = "línea 1\tcon tab\nlínea 2 con \\barra\r\n"
+    assert copy_value(text) == text
+
+
+def test_copy_type_tabla_ppi():
+    types = {column.name: copy_type(column) for column in TablaPPI.__table__.columns}
+    assert types == {
+        'id': 'int8',
+        'Date': 'timestamp',
+        'Price': 'float8',
+        'Volume': 'float8',
+        'Opening': 'float8',
+        'Min': 'float8',
+        'Max': 'float8',
+        'ticker': 'text',
+        'settlement': 'text',
+        'instrument_type': 'text',
+        'currency': 'text',
+        'variacion_diaria': 'float8',
+    }
+
+
+def test_copy_type_unmapped_column():
+    with pytest.raises(TypeError):
+        copy_type(TablaPostsBluesky.__table__.c.text_tsv)
+
+
+def test_bulk_copy_binary_tabla_ppi_with_conflict_target():
+    db = FakeSession()
+    rows = [
+        # Key order differs from the table: columns follow the model
+        {'ticker': 'AAPLD', 'Price': np.float64(10.5), 'Date': pd.Timestamp('2025-01-02', tz='UTC'), 'Volume': np.nan},
+        {'ticker': 'KOD', 'Price': 3.0, 'Date': pd.Timestamp('2025-01-03'), 'Volume': np.int64(100)},
+    ]
+
+    added = bulk_copy(db, TablaPPI, rows, conflict_target=[func.date(TablaPPI.Date), TablaPPI.ticker], binary=True)
+
+    assert added == FakeResult.rowcount
+    assert db.cursor.statements[0] == "SET LOCAL synchronous_commit = OFF"
+    assert db.cursor.statements[1] == "DROP TABLE IF EXISTS tmp_tabla_ppi"
+    assert db.cursor.statements[2].startswith('CREATE TEMP TABLE tmp_tabla_ppi ON COMMIT DROP AS SELECT "Date", "Price", "Volume", "ticker"')
+    assert db.cursor.copy_sql == 'COPY tmp_tabla_ppi ("Date", "Price", "Volume", "ticker") FROM STDIN (FORMAT BINARY)'
+    assert db.cursor.copy_obj.types == ['timestamp', 'float8', 'float8', 'text']
+    assert db.cursor.copy_obj.rows == [
+        [datetime(2025, 1, 2), 10.5, None, 'AAPLD'],
+        [datetime(2025, 1, 3), 3.0, 100, 'KOD'],
+    ]
+    assert len(db.executed) == 1
+    assert 'INSERT INTO tabla_ppi ("Date", "Price", "Volume", ticker)' in db.executed[0]
+    assert db.executed[0].endswith('ON CONFLICT (date("Date"), ticker) DO NOTHING')
+
+
+def test_bulk_copy_text_mode_without_conflict_target():
+    db = FakeSession()
+    text = "hola\tmundo\ncon \\barra"
+    rows = [{'actor_handle': 'a.bsky', 'uri': 'at://a/1', 'text': text, 'created_at': datetime(2025, 1, 2), 'likes': np.int32(4)}]
+
+    added = bulk_copy(db, TablaPostsBluesky, rows)
+
+    assert added == db.cursor.rowcount
+    assert db.cursor.statements == ["SET LOCAL synchronous_commit = OFF"]
+    assert db.cursor.copy_sql == (
+        'COPY tabla_posts_bluesky ("actor_handle", "uri", "text", "created_at", "likes") FROM STDIN (FORMAT TEXT)'
+    )
+    assert db.cursor.copy_obj.types is None
+    assert db.cursor.copy_obj.rows == [['a.bsky', 'at://a/1', text, datetime(2025, 1, 2), 4]]
+    assert db.executed == []
+
+
+def test_bulk_copy_empty_rows():
+    db = FakeSession()
+    assert bulk_copy(db, TablaPPI, []) == 0
+    assert db.cursor.statements == []
+    assert db.cursor.copy_sql is None